@@ -0,0 +1,284 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function
+"""
+Mosketch for maya, offline take conversion.
+Runs without Maya. Converts a directory of takes (see mosketch_takes) into baked curve files, one process per core:
+each take is decoded, posed with the rest data of the character (mosketch_for_maya.export_rest_data()),
+reduced (see mosketch_keyreduce) and written as <take name>.curves.json for mosketch_for_maya.import_baked_curves().
+
+    python mosketch_convert.py takes_dir rest.json -o curves_dir -j 8
+
+Quaternions are (x, y, z, w). The pose math is the one of the bridge's JointsStream path, written with
+Maya's quaternion product: Maya's a * b applies a first, that is the Hamilton product b * a.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import multiprocessing
+
+import mosketch_takes
+import mosketch_keyreduce
+from mosketch_keyreduce import multiply_quaternions
+
+
+CURVES_FORMAT = "mosketch-curves"
+CURVES_VERSION = 1
+REST_DATA_VERSION = 1 # Must match REST_DATA_VERSION in mosketch_for_maya
+CHANNELS = ("rotateX", "rotateY", "rotateZ", "translateX", "translateY", "translateZ")
+
+
+class ConvertError(Exception):
+    pass
+
+
+################################################################################
+##########          MAYA QUATERNION MATH
+################################################################################
+def maya_multiply(a, b):
+    '''
+    Maya's MQuaternion a * b: a is applied first.
+    '''
+    return multiply_quaternions(b, a)
+
+
+def inverse(quat):
+    return (-quat[0], -quat[1], -quat[2], quat[3])
+
+
+def rotate_vector(vector, quat):
+    '''
+    MVector.rotateBy(MQuaternion).
+    '''
+    x, y, z, w = multiply_quaternions(multiply_quaternions(quat, (vector[0], vector[1], vector[2], 0.0)), inverse(quat))
+    return (x, y, z)
+
+
+def quaternion_to_euler(quat, rotate_order=0):
+    '''
+    Return the euler angles (radians) of quat in the Maya rotate_order (see mosketch_keyreduce.ROTATE_ORDERS).
+    '''
+    x, y, z, w = quat
+    # Rotation matrix for column vectors
+    matrix = ((1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y - z * w), 2.0 * (x * z + y * w)),
+              (2.0 * (x * y + z * w), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z - x * w)),
+              (2.0 * (x * z - y * w), 2.0 * (y * z + x * w), 1.0 - 2.0 * (x * x + y * y)))
+    first, second, third = mosketch_keyreduce.ROTATE_ORDERS[int(rotate_order)]
+    # xyz, yzx and zxy are even permutations of the axes
+    sign = 1.0 if (second - first) % 3 == 1 else -1.0
+
+    angles = [0.0, 0.0, 0.0]
+    cos_second = math.hypot(matrix[third][second], matrix[third][third])
+    angles[second] = math.atan2(-sign * matrix[third][first], cos_second)
+    # Rounding errors on the matrix are ~1e-16: the atan2 pairs are off by about 1e-16 / cos_second,
+    # the gimbal lock branch by about cos_second. This bound keeps both around 1e-7 rad
+    if cos_second > 1e-8:
+        angles[first] = math.atan2(sign * matrix[third][second], matrix[third][third])
+        angles[third] = math.atan2(sign * matrix[second][first], matrix[first][first])
+    else:
+        # Gimbal lock: only the sum (or difference) of first and third is known, keep third at 0
+        angles[first] = math.atan2(-sign * matrix[second][third], matrix[second][second])
+    return angles
+
+
+def get_closest_euler(angles, previous, rotate_order=0):
+    '''
+    Return the euler rotation equal to angles that is the closest to previous (no flips along a curve).
+    '''
+    first, second, third = mosketch_keyreduce.ROTATE_ORDERS[int(rotate_order)]
+    other = list(angles)
+    other[first] += math.pi
+    other[second] = math.pi - other[second]
+    other[third] += math.pi
+    best = None
+    best_distance = None
+    for candidate in (angles, other):
+        candidate = [angle - 2.0 * math.pi * round((angle - previous_angle) / (2.0 * math.pi)) for angle, previous_angle in zip(candidate, previous)]
+        distance = sum([abs(angle - previous_angle) for angle, previous_angle in zip(candidate, previous)])
+        if best is None or distance < best_distance:
+            best = candidate
+            best_distance = distance
+    return best
+
+
+################################################################################
+##########          CONVERT
+################################################################################
+def load_rest_data(file_path):
+    with open(file_path, "r") as rest_stream:
+        rest_data = json.load(rest_stream)
+    if rest_data.get("version") != REST_DATA_VERSION:
+        raise ConvertError(file_path + " is not rest data of version " + str(REST_DATA_VERSION))
+    return rest_data
+
+
+def convert_take(take_path, rest_data, output_dir, rotation_tolerance, translation_tolerance):
+    '''
+    Write the curves of one take, return its statistics.
+    '''
+    start_time = time.time()
+    take = mosketch_takes.Take(take_path)
+    try:
+        frames_values = [take.get_frame(frame) for frame in range(take.frame_count)]
+        joints_name = take.joints_name
+        fps = take.fps
+    finally:
+        take.close()
+
+    curves = {}
+    raw_keys = 0
+    keys = 0
+    max_angle = 0.0
+    for slot, joint_name in enumerate(joints_name):
+        rest = rest_data["joints"].get(joint_name)
+        if rest is None:
+            continue
+        channels = _pose_joint(frames_values, slot * mosketch_takes.VALUES_PER_JOINT, rest)
+        frames = channels[0]
+        if not frames:
+            continue
+        node = rest["node"]
+
+        rotate_channels = [channel for channel in range(3) if max(channels[channel + 1]) - min(channels[channel + 1]) >= 1e-9]
+        if rotate_channels:
+            kept, angle = mosketch_keyreduce.reduce_rotation(frames, channels[1], channels[2], channels[3], rest["rotate_order"], rotation_tolerance)
+            max_angle = max(max_angle, angle)
+            for channel in rotate_channels:
+                curves[node + "." + CHANNELS[channel]] = _get_curve(frames, channels[channel + 1], kept)
+                raw_keys += len(frames)
+                keys += len(kept)
+
+        translation_frames = channels[4]
+        for channel in range(3, 6):
+            values = channels[channel + 2]
+            if not translation_frames or max(values) - min(values) < 1e-9:
+                continue
+            kept, distance = mosketch_keyreduce.reduce_channel(translation_frames, values, translation_tolerance)
+            curves[node + "." + CHANNELS[channel]] = _get_curve(translation_frames, values, kept)
+            raw_keys += len(translation_frames)
+            keys += len(kept)
+
+    take_name = os.path.splitext(os.path.basename(take_path))[0]
+    output_path = os.path.join(output_dir, take_name + ".curves.json")
+    with open(output_path, "w") as curves_stream:
+        json.dump({"format": CURVES_FORMAT, "version": CURVES_VERSION, "take": take_name, "fps": fps,
+                   "model": rest_data.get("model"), "curves": curves}, curves_stream)
+    return {"take": take_name, "frames": len(frames_values), "curves": len(curves), "raw_keys": raw_keys, "keys": keys,
+            "max_angle": math.degrees(max_angle), "seconds": time.time() - start_time}
+
+
+def _pose_joint(frames_values, base, rest):
+    '''
+    Maya local values of one joint on every frame it was streamed:
+    [frames, rx, ry, rz, translation frames, tx, ty, tz], rotations in radians, translations in cm.
+    '''
+    rotate_axis_inv = tuple(rest["rotate_axis_inv"])
+    joint_orient_inv = tuple(rest["joint_orient_inv"])
+    rotate_order = rest["rotate_order"]
+    pre_transform = rest.get("root_pre_transform")
+    offset = rest.get("root_offset")
+    channels = [[], [], [], [], [], [], [], []]
+    previous = None
+    for frame, values in enumerate(frames_values):
+        if values[base + 3] != values[base + 3]:
+            continue # NaN: not streamed yet
+        quat = (values[base], values[base + 1], values[base + 2], values[base + 3])
+        # W = [S] * [RO] * [R] * [JO] * [IS] * [T]
+        quat = maya_multiply(maya_multiply(rotate_axis_inv, quat), joint_orient_inv)
+        if pre_transform is not None:
+            quat = maya_multiply(maya_multiply(inverse(pre_transform), quat), pre_transform)
+        angles = quaternion_to_euler(quat, rotate_order)
+        if previous is not None:
+            angles = get_closest_euler(angles, previous, rotate_order)
+        previous = angles
+        channels[0].append(frame)
+        channels[1].append(angles[0])
+        channels[2].append(angles[1])
+        channels[3].append(angles[2])
+
+        if values[base + 4] == values[base + 4]:
+            # Mosketch uses meters. Maya uses centimeters
+            translation = rotate_vector((values[base + 4], values[base + 5], values[base + 6]), rotate_axis_inv)
+            translation = [value * 100.0 for value in translation]
+            if offset is not None:
+                translation = [value - offset_value for value, offset_value in zip(translation, offset)]
+            channels[4].append(frame)
+            channels[5].append(translation[0])
+            channels[6].append(translation[1])
+            channels[7].append(translation[2])
+    return channels
+
+
+def _get_curve(frames, values, kept):
+    return {"frames": [frames[index] for index in kept], "values": [values[index] for index in kept]}
+
+
+################################################################################
+##########          PROCESS POOL
+################################################################################
+WORKER_ARGS = None # (rest data, output dir, rotation tolerance, translation tolerance) in each worker
+
+
+def _init_worker(*args):
+    global WORKER_ARGS
+    WORKER_ARGS = args
+
+
+def _convert_take_job(take_path):
+    try:
+        return convert_take(take_path, *WORKER_ARGS)
+    except Exception as e:
+        return {"take": os.path.basename(take_path), "error": type(e).__name__ + ": " + str(e)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Mosketch takes into baked curve files, in parallel.")
+    parser.add_argument("takes_dir", help="directory of .msktake files")
+    parser.add_argument("rest_data", help="rest data exported from Maya (mosketch_for_maya.export_rest_data)")
+    parser.add_argument("-o", "--output", help="curves directory (takes_dir by default)")
+    parser.add_argument("-j", "--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--rotation-tolerance", type=float, default=0.1, help="degrees (default 0.1)")
+    parser.add_argument("--translation-tolerance", type=float, default=0.01, help="cm (default 0.01)")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output or args.takes_dir
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    rest_data = load_rest_data(args.rest_data)
+    take_paths = sorted([os.path.join(args.takes_dir, file_name) for file_name in os.listdir(args.takes_dir) if file_name.endswith(".msktake")])
+    if not take_paths:
+        print("no .msktake file in " + args.takes_dir)
+        return 1
+
+    start_time = time.time()
+    worker_args = (rest_data, output_dir, math.radians(args.rotation_tolerance), args.translation_tolerance)
+    pool = multiprocessing.Pool(min(args.processes, len(take_paths)), _init_worker, worker_args)
+    results = []
+    try:
+        for result in pool.imap_unordered(_convert_take_job, take_paths):
+            if "error" in result:
+                print(result["take"] + ": " + result["error"])
+            else:
+                print(result["take"] + ": " + str(result["frames"]) + " frames, " + str(result["curves"]) + " curves, "
+                      + str(result["raw_keys"]) + " keys to " + str(result["keys"]) + ", max error " + "%.3f" % result["max_angle"]
+                      + " deg, " + "%.2f" % result["seconds"] + " s")
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+    total_time = time.time() - start_time
+
+    converted = [result for result in results if "error" not in result]
+    frame_count = sum([result["frames"] for result in converted])
+    busy_time = sum([result["seconds"] for result in converted])
+    print(str(len(converted)) + "/" + str(len(take_paths)) + " takes converted in " + "%.2f" % total_time + " s with "
+          + str(min(args.processes, len(take_paths))) + " processes: " + "%.0f" % (frame_count / max(total_time, 0.000001)) + " frames/s, "
+          + "%.1f" % (busy_time / max(total_time, 0.000001)) + "x parallel speedup")
+    return 0 if len(converted) == len(take_paths) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,15 +6,28 @@ Mosketch for maya.
 See https://github.com/MokaStudio/MosketchForMaya for more informations.
 """
 
-import os, sys, locale
+import os, sys, locale, time
 
 import json
+import array
+import collections
+import hashlib
+import math
 
 import pymel.core as pmc
+import maya.OpenMaya as OpenMaya
+import maya.api.OpenMaya as OpenMaya2
+import maya.api.OpenMayaAnim as OpenMayaAnim2
 import maya.OpenMayaUI as OpenMayaUI
+import maya.cmds as cmds
 import maya.mel as mel
 import socket
 
+import mosketch_session_log
+import mosketch_takes
+import mosketch_keyreduce
+import mosketch_convert
+
 # Support for Qt4 and Qt5 depending on Maya version
 from Qt import QtCore
 from Qt import QtGui
@@ -44,6 +57,10 @@ JSON_KEY_ANATOMIC = "Anatom"
 JSON_KEY_ROTATION = "LR"
 JSON_KEY_TRANSLATION = "LT"
 JSON_KEY_JOINTS = "Joints"
+JSON_KEY_FRAME = "Frame"
+JSON_KEY_SEQUENCE = "Seq"
+JSON_KEY_SENT_AT = "SentAt"
+JSON_KEY_APPLY_MS = "ApplyMs"
 JSON_KEY_OBJECT = "object"
 JSON_KEY_COMMAND = "command"
 JSON_KEY_PARAMETERS = "parameters"
@@ -52,24 +69,138 @@ JSON_KEY_PARAMETERS = "parameters"
 PACKET_TYPE_COMMAND = "NetCommand"
 
 # MAYA JOINTS BUFFERS
+# Rest transforms are cached in both directions: inverses for the receive path, forward values for the send path
 JOINTS_BUFFER = {}
 JOINTS_INIT_ORIENT_INV_BUFFER = {}
 JOINTS_ROTATE_AXIS_INV_BUFFER = {}
-INTER_JOINTS_BUFFER = {}
-JOINTS_UUIDS = {}
+JOINTS_INIT_ORIENT_BUFFER = {}
+JOINTS_ROTATE_AXIS_BUFFER = {}
+INTER_JOINTS_BUFFER = {} # Mapped joints with no controller to drive them (rigged models only)
+INTER_JOINTS_CHUNK = 200 # Joints per InterJoints packet
+
+# Joints sent as non sketchable by _send_static_inter_joints (profiles may override them with static_inter_joints)
+STATIC_INTER_JOINTS = [
+    "HipPart1_L", "HipPart2_L"
+]
+
+# Mosketch joint uuids (JointsUuids packet), indexed both ways with the hierarchy slots (index in HIERARCHY_JOINTS)
+JOINTS_UUIDS = {} # {mosketch name: uuid}
+UUIDS_SLOT = {} # {uuid: slot}
+SLOTS_UUID = [] # [uuid or None per slot]
+HIERARCHY_SLOTS = {} # {mosketch name: slot}
 CONTROLLERS_BUFFER = {}
 CONTROLLERS_INIT_ORIENT_INV_BUFFER = {}
 CONTROLLERS_ROTATE_AXIS_INV_BUFFER = {}
+CONTROLLERS_INIT_ORIENT_BUFFER = {}
+CONTROLLERS_ROTATE_AXIS_BUFFER = {}
+
+# Maya node UUIDs of the mapped nodes: handles are refreshed through them when a node is renamed or reparented
+MAYA_UUIDS = {} # {(mosketch name, is controller): maya uuid}
+MAYA_UUID_ENTRIES = {} # {maya uuid: set of (mosketch name, is controller)}
+MAYA_UUID_CALLBACKS = {} # {maya uuid: [callback ids]}
+
+# Maya callback ids refreshing the rest transforms when rotateAxis or jointOrient change
+REST_CALLBACKS = {} # {(mosketch name, is controller): callback id}
+
+# Live mode: Maya edits are pushed to Mosketch at a fixed rate (only the dirty joints)
+LIVE_MODE = False
+LIVE_RATE = 30 # Hz
+LIVE_TIMER = None
+LIVE_CALLBACKS = {} # {mosketch name: callback id}
+LIVE_DIRTY = set()
+# Long names of the plugs that make a joint dirty (not rotatePivot, rotateAxis, rotateOrder...)
+LIVE_ATTRIBUTES = frozenset(["rotate", "rotateX", "rotateY", "rotateZ", "translate", "translateX", "translateY", "translateZ"])
+LIVE_APPLYING = False # True while we apply a Mosketch stream, so we don't echo it back
+
+# Timeline streaming: number of frames packed in one write
+TIMELINE_BATCH_SIZE = 25
+
+# Bulk pose readback for the send path. One slot per mapped joint (or controller for rigged models).
+# Built lazily from the current mapping, reset whenever the mapping or a rest transform changes.
+POSE_NAMES = None                 # Mosketch joint name per slot (None until built)
+POSE_SLOTS = {}                   # Mosketch joint name => slot
+POSE_PLUGS = []                   # 7 API 2.0 plugs per slot: rx, ry, rz, tx, ty, tz, rotateOrder
+POSE_REST = []                    # (rotate axis, joint orient) API 2.0 quaternions per slot
+POSE_ROOT_SLOT = -1               # Slot of the rigged root controller which has offsets, -1 if none
+POSE_ROOT_PLUGS = []              # API 2.0 plugs of the root offsets: offset tx, ty, tz then pre transform rx, ry, rz, rotateOrder
+POSE_ROOT_RAW = array.array('d', [0.0]) * 7 # POSE_ROOT_PLUGS values as read, with the slots
+POSE_RAW = array.array('d')       # 7 values per slot as read: rx, ry, rz (radians), tx, ty, tz (cm), rotateOrder
+POSE_VALUES = array.array('d')    # 7 values per slot as sent: LR x, y, z, w then LT x, y, z (meters)
+POSE_PREFIXES = []                # Encoded '{"Name":"<joint>","LR":[' per slot
+POSE_JOINTS_FORMAT = b''          # Encoded "Joints" array of all slots, formatted with the 7 values per slot at once
+POSE_BUFFER = bytearray()         # Reused for every outgoing JointsStream
+
+# Outgoing JointsStream encoding. Floats use repr like json.dumps does, so finite values are identical on the wire.
+# repr writes nan and inf (json.dumps NaN and Infinity), Mosketch parses neither: see _check_finite_pose.
+JOINTS_STREAM_HEADER = b'{"' + JSON_KEY_TYPE.encode("ascii") + b'":"JointsStream",'
+JOINTS_STREAM_FRAME_FORMAT = b'"' + JSON_KEY_FRAME.encode("ascii") + b'":%r,'
+JOINTS_STREAM_SEQUENCE_FORMAT = b'"' + JSON_KEY_SEQUENCE.encode("ascii") + b'":%d,"' + JSON_KEY_SENT_AT.encode("ascii") + b'":%r,'
+JOINTS_STREAM_JOINTS = b'"' + JSON_KEY_JOINTS.encode("ascii") + b'":['
+JOINT_VALUES_FORMAT = b'%r,%r,%r,%r],"' + JSON_KEY_TRANSLATION.encode("ascii") + b'":[%r,%r,%r]}'
 
 # Verbose level (1 for critical informations, 3 to output all packets)
 VERBOSE = 1
 
+# Session recorder (see start_recording), None when not recording
+RECORDER = None
+
+# End-to-end latency. JointsStreams carry Seq and SentAt (seconds, sender's clock), acks echo them back.
+#   apply: from reading a Mosketch JointsStream to the pose being set (acked with ApplyMs)
+#   round_trip: from sending a JointsStream to Mosketch's JointsStreamAck
+LATENCY_WINDOW = 1000             # Samples behind the rolling percentiles
+LATENCY_BUCKET_MS = 0.5           # Session histograms resolution, the last bucket takes everything above
+LATENCY_BUCKETS = 2000
+LATENCY_SAMPLES = {"apply": collections.deque(maxlen=LATENCY_WINDOW), "round_trip": collections.deque(maxlen=LATENCY_WINDOW)}
+LATENCY_HISTOGRAMS = {"apply": array.array('L', [0]) * LATENCY_BUCKETS, "round_trip": array.array('L', [0]) * LATENCY_BUCKETS}
+LATENCY_REFRESH_MS = 500          # Window refresh period
+STREAM_SEQUENCE = 0               # Seq of the last JointsStream sent
+STREAM_SENT_TIMES = collections.OrderedDict() # {Seq: send time} waiting for their ack, LATENCY_WINDOW at most
+STREAM_RECEIVED_AT = None         # Time the JointsStream being applied was read
+
+# Pose capture (see start_capture): every applied JointsStream is read back through the pose plan
+CAPTURE_TIMES = None              # array('d') of seconds since start_capture, None when not capturing
+CAPTURE_VALUES = array.array('d') # POSE_RAW of every captured frame, back to back
+CAPTURE_NAMES = None              # POSE_NAMES the capture was started with
+CAPTURE_PLUGS = []                # POSE_PLUGS the capture was started with
+CAPTURE_START = 0.0
+CAPTURE_START_FRAME = 0.0
+
+# Keyframe reduction of baked captures (see mosketch_keyreduce), reduced curves have linear tangents.
+# It runs in stop_capture on Maya's main thread: benchmark_bake_capture times it on a 5,000 frames x 300 joints capture.
+# Turn it off to bake every frame and reduce offline (mosketch_convert.py).
+KEY_REDUCTION = True
+KEY_ROTATION_TOLERANCE = 0.1      # Degrees between the captured rotation and the baked one
+KEY_TRANSLATION_TOLERANCE = 0.01  # Scene units (cm)
+
+# Offline conversion (see mosketch_convert.py)
+REST_DATA_VERSION = 1
+CURVES_FORMAT = "mosketch-curves"
+CURVES_VERSION = 1
+
+# Take scrubbing (see open_take)
+TAKE = None                       # Opened mosketch_takes.Take
+TAKE_START_FRAME = 0.0            # Scene frame of the take's frame 0
+TAKE_FRAME_SCALE = 1.0            # Take frames per scene frame
+TAKE_CALLBACK = None              # timeChanged callback id when scrubbing with the time slider
+
 # Some models have pre transform we need to take into account
 ROOTS_SYSTEM = {}
 
-# RIG Prefix (usually for Advanced Skeleton)
-PREFIX_FKX = ""
-PREFIX_FK = ""
+# Scene lookups of the current hierarchy in every namespace, {short name: {namespace: [long paths]}}
+# Names are queried once, found or not, so switching namespace needs no rescan
+SCENE_JOINTS = {}
+SCENE_TRANSFORMS = {}
+SCENE_QUERY_CHUNK = 500 # Names per ls call
+HIERARCHY_JOINTS = [] # Mosketch joint names of the last Hierarchy packet
+
+# Namespace of the character to bind to ("" for the root namespace). None binds to the namespace matching most joints
+NAMESPACE = None
+MAPPING_NAMESPACE = None # Namespace actually bound
+
+# On-disk mapping cache: node paths and rest transforms, one file per scene, model, namespace and hierarchy
+MAPPING_CACHE = True
+MAPPING_CACHE_VERSION = 2
+MAPPING_CACHE_DIR = None # None for <Maya user app dir>/mosketch_cache
 
 ################################################################################
 # Define a model name to perform specific actions
@@ -100,6 +231,141 @@ DEEPSEA_FKX_BIND = [
   "BodyFinLowerB1_R", "BodyFinLowerB1Part1_R", "BodyFinLowerB1Part2_R"
 ]
 
+# mosketch_DeepSea.py keeps these upper body fins on their FK controller (its FKX set has 85 names)
+DEEPSEA_UPPER_FINS_FK_BIND = [
+  "bodyFinUpper1_M", "bodyFinUpper1Part1_M", "bodyFinUpper2_M", "bodyFinUpper2Part1_M",
+  "BodyFinUpper1_M", "BodyFinUpper1Part1_M", "BodyFinUpper2_M", "BodyFinUpper2Part1_M"
+]
+
+
+################################################################################
+# Rig profiles: naming rules of each model. New rigs only need a new entry.
+#   controllers: True to drive the rig controllers, False to drive the joints
+#   joints_any_transform: map Mosketch joints onto any transform with the same name, not only Maya joints
+#   controller_prefix: controller of a joint is prefixed with it (usually 'FK' for Advanced Skeleton)
+#   fkx_prefix, fkx_joints: joints driven through their 'FKX' controller instead
+#   controller_exceptions: {joint name: controller name} for joints escaping the prefix rules
+#   root_controller: controller with a pre transform (root_pre_transform) and a translation offset (root_offset)
+#   root_system: root nodes looked up in the scene
+#   root_send_offsets: False to send root_controller as it is, its offsets are then only removed from what Mosketch sends
+#   orient_mode: sent to Mosketch once the hierarchy is mapped, None to keep Mosketch's
+#   signature: nodes found in scenes of this model, used by start("Auto") (see _detect_rig_profile)
+#   signature_absent: nodes never found in scenes of this model, they tell apart models whose signatures overlap
+#   static_inter_joints: joints sent as non sketchable by _send_static_inter_joints
+#   send_static_inter_joints: True to send static_inter_joints with every Hierarchy
+# Profiles of the rig artifact (RIG_ARTIFACT_FILE, see mosketch_rig_compiler.py) are added to these at load.
+################################################################################
+RIG_PROFILES = {
+    "Mosko_noRig": {
+        "controllers": False,
+        "orient_mode": 1,
+    },
+    "Mosko_Rigged": {
+        "controllers": True,
+        "controller_prefix": "FK",
+        "fkx_prefix": "FKX",
+        # We are missing controllers for end toes in Mosko, so we plug joint onto joint
+        "controller_exceptions": {"RootX_M": "RootX_M", "ToesEnd_L": "ToesEnd_L", "ToesEnd_R": "ToesEnd_R"},
+        "root_controller": "RootX_M",
+        "root_pre_transform": "FKOffsetRoot_M",
+        "root_offset": "RootCenter_M",
+        "root_system": ["FKOffsetRoot_M", "RootCenter_M", "RootSystem"],
+        "orient_mode": 0,
+        "signature": ["FKOffsetRoot_M", "RootCenter_M", "RootSystem", "FKSystem", "FKRoot_M"],
+        "signature_absent": ["RootOffsetX_M"],
+    },
+    # Bindings of mosketch_Mosko.py: the neck is driven through its FKX controllers
+    "Mosko_Rigged_NeckFKX": {
+        "controllers": True,
+        "controller_prefix": "FK",
+        "fkx_prefix": "FKX",
+        "fkx_joints": ["Neck_M", "NeckPart1_M", "NeckPart2_M"],
+        "controller_exceptions": {"RootX_M": "RootX_M", "ToesEnd_L": "ToesEnd_L", "ToesEnd_R": "ToesEnd_R"},
+        "root_controller": "RootX_M",
+        "root_pre_transform": "FKOffsetRoot_M",
+        "root_offset": "RootCenter_M",
+        "root_system": ["FKOffsetRoot_M", "RootCenter_M", "RootSystem"],
+        "orient_mode": 0,
+        # Part joints follow their parent: Mosketch must not sketch them
+        "static_inter_joints": [
+            "HipPart1_L", "HipPart2_L", "ShoulderPart1_L", "ShoulderPart2_L", "ElbowPart1_L", "ElbowPart2_L", "RootPart1_M", "RootPart2_M",
+            "NeckPart1_M", "NeckPart2_M", "HipPart1_R", "HipPart2_R", "ShoulderPart1_R", "ShoulderPart2_R", "ElbowPart1_R", "ElbowPart2_R"
+        ],
+        "send_static_inter_joints": True,
+    },
+    "DeepSea_Rigged": {
+        "controllers": True,
+        "controller_prefix": "FK",
+        "fkx_prefix": "FKX",
+        "fkx_joints": DEEPSEA_FKX_BIND,
+        "controller_exceptions": {"RootX_M": "RootX_M"},
+        "root_controller": "RootX_M",
+        "root_pre_transform": "FKOffsetRoot_M",
+        "root_offset": "RootOffsetX_M",
+        "root_system": ["FKOffsetRoot_M", "RootOffsetX_M"],
+        "signature": ["FKOffsetRoot_M", "RootOffsetX_M", "FKXtailMain1_M", "FKXBodyFinSide2_L", "FKXBodyFinSide2_R"],
+    },
+    # Bindings of mosketch_DeepSea.py
+    "DeepSea_Rigged_UpperFinsFK": {
+        "controllers": True,
+        "controller_prefix": "FK",
+        "fkx_prefix": "FKX",
+        "fkx_joints": [joint_name for joint_name in DEEPSEA_FKX_BIND if joint_name not in DEEPSEA_UPPER_FINS_FK_BIND],
+        "controller_exceptions": {"RootX_M": "RootX_M"},
+        "root_controller": "RootX_M",
+        "root_pre_transform": "FKOffsetRoot_M",
+        "root_offset": "RootOffsetX_M",
+        "root_system": ["FKOffsetRoot_M", "RootOffsetX_M"],
+    },
+    # Mokto joints are driven directly, its root joint still has a pre transform and an offset.
+    # Like mosketch_Mokto.py, the root joint is sent without them.
+    "Mokto": {
+        "controllers": False,
+        "joints_any_transform": True,
+        "root_controller": "RootX_M",
+        "root_pre_transform": "FKOffsetRoot_M",
+        "root_offset": "RootCenter_M",
+        "root_system": ["FKOffsetRoot_M", "RootCenter_M"],
+        "root_send_offsets": False,
+        "orient_mode": 1,
+        "signature": ["FKOffsetRoot_M", "RootCenter_M"],
+        # Mokto joints have no FK controllers
+        "signature_absent": ["FKRoot_M"],
+    },
+    # Named like Mosko_noRig, nothing tells them apart in the scene: start it by name
+    "MoskoV51_noRig": {
+        "controllers": False,
+        "joints_any_transform": True,
+        "orient_mode": 1,
+    },
+}
+
+# Short names accepted by start()
+RIG_PROFILE_ALIASES = {
+    "": "Mosko_noRig",
+    "noRig": "Mosko_noRig",
+    "Rig": "Mosko_Rigged",
+    "Deep": "DeepSea_Rigged",
+}
+
+# start("Auto") picks the profile from the scene before each connection
+AUTO_DETECT_RIG = False
+RIG_DETECT_FALLBACK = "Mosko_noRig" # Profile used when no signature is found (non-rigged models have none)
+RIG_DETECT_MIN_CONFIDENCE = 0.5     # Part of a signature that must be found
+
+# Artifact written by mosketch_rig_compiler.py, loaded at start when present
+RIG_ARTIFACT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mosketch_rigs.json")
+RIG_ARTIFACT_FORMAT = "mosketch-rigs"
+RIG_ARTIFACT_VERSION = 1
+
+# RIG_PROFILES compiled at load (see _compile_rig_profile), RIG is the one of MODEL_NAME
+COMPILED_RIG_PROFILES = {}
+RIG = None
+# Keys the rig compiler adds to the profiles of the artifact: not part of a rig description
+RIG_COMPILED_KEYS = ("hierarchy", "controller_names")
+# Controller names precomputed in the artifact, only when it was compiled for the current Hierarchy (see _check_rig_hierarchy)
+RIG_CONTROLLER_NAMES = {}
+
 
 ################################################################################
 ##########          MAIN FUNCTIONS
@@ -131,27 +397,78 @@ def install():
 # shelf start button
 #in model_name must be a string to specify a model
 ################################################################################
-def start(model_name):
+def start(model_name="Auto"):
     """
     Call this function from Maya (in a shelf button or in script editor for example):
         import mosketch_for_maya
         mosketch_for_maya.start("noRig")
-        model_name can be "" or "noRig" for non-rigged characters
+        model_name can be "Auto" to detect the model from the scene (again before each connection)
+          "" or "noRig" for non-rigged characters
           "Rig" for Mosko_Rigged
           "Deep" for DeepSea_Rigged
+          or any RIG_PROFILES name ("Mokto", "MoskoV51_noRig"...)
     """
     global MODEL_NAME
-
-    if (model_name == 'noRig'):
-        MODEL_NAME = 'Mosko_noRig'
-    elif (model_name == 'Rig'):
-        MODEL_NAME = 'Mosko_Rigged'
-    elif (model_name == 'Deep'):
-        MODEL_NAME = 'DeepSea_Rigged'
+    global RIG
+    global AUTO_DETECT_RIG
+
+    AUTO_DETECT_RIG = (model_name == "Auto")
+    if AUTO_DETECT_RIG:
+        model_name = _detect_rig_profile()
+    model_name = RIG_PROFILE_ALIASES.get(model_name, model_name)
+    if model_name in COMPILED_RIG_PROFILES:
+        MODEL_NAME = model_name
+    else:
+        print 'Unknown model name ' + model_name
+    RIG = COMPILED_RIG_PROFILES[MODEL_NAME]
     print 'Model name = ' + MODEL_NAME
     _create_gui()
 
 
+################################################################################
+# Write the rig profiles as a rig description for mosketch_rig_compiler.py
+################################################################################
+def export_rig_profiles(file_path):
+    """
+    Call this function to start a rig description from the built-in profiles:
+        mosketch_for_maya.export_rig_profiles("C:/rigs/rigs.json")
+    """
+    # Profiles loaded from the artifact lose their compiled keys: the compiler computes them again
+    profiles = {}
+    for model_name, profile in RIG_PROFILES.items():
+        profiles[model_name] = dict((key, value) for key, value in profile.items() if key not in RIG_COMPILED_KEYS)
+    with open(file_path, "w") as description_stream:
+        json.dump({"profiles": profiles}, description_stream, indent=1, sort_keys=True)
+    print "Rig profiles written to " + file_path
+
+
+################################################################################
+# Bind to another character
+################################################################################
+def set_namespace(namespace=None):
+    """
+    Call this function to bind Mosketch to the character referenced under namespace:
+        mosketch_for_maya.set_namespace("hero01")
+        namespace "" is the root namespace, None binds to the namespace matching most joints.
+    Switching characters reuses the scene lookups of the last hierarchy: no rescan.
+    """
+    global NAMESPACE
+
+    if namespace is not None:
+        namespace = namespace.strip(":")
+    NAMESPACE = namespace
+
+    if CONNECTION is not None and HIERARCHY_JOINTS:
+        # A mapping loaded from the cache has no scene lookups yet
+        _query_hierarchy()
+        if not _map_hierarchy([]):
+            # No namespace matched any joint when binding to the best one
+            if MAPPING_NAMESPACE is None:
+                _print_error("Couldn't map joints: no namespace matches the hierarchy.")
+            else:
+                _print_error("Couldn't map joints in namespace '" + MAPPING_NAMESPACE + "'.")
+
+
 ################################################################################
 # shelf stop button
 ################################################################################
@@ -163,10 +480,577 @@ def stop():
     # Close connection if any is still opened
     if CONNECTION is not None:
         _close_connection()
+    if RECORDER is not None:
+        stop_recording()
+    stop_capture()
+    close_take()
 
     _destroy_gui()
 
 
+################################################################################
+# Record what Mosketch sends (to replay a session)
+################################################################################
+def start_recording(file_path):
+    """
+    Call this function to append every packet received from Mosketch to a session log:
+        mosketch_for_maya.start_recording("C:/sessions/session.msklog")
+    Packets are written from a background thread (see mosketch_session_log).
+    """
+    global RECORDER
+
+    if RECORDER is not None:
+        stop_recording()
+    try:
+        RECORDER = mosketch_session_log.Recorder(file_path)
+    except (IOError, mosketch_session_log.LogError) as e:
+        _print_error("cannot record to " + file_path + " (" + str(e) + ")")
+        return
+    _print_success("recording to " + file_path)
+
+
+def stop_recording():
+    """
+    Call this function to stop recording, it reports the recorder overhead and the dropped packets:
+        mosketch_for_maya.stop_recording()
+    """
+    global RECORDER
+
+    if RECORDER is None:
+        return
+    recorder = RECORDER
+    RECORDER = None
+    recorder.close()
+    print "Recorded to " + recorder.file_path + ": " + recorder.get_report()
+
+
+################################################################################
+# Capture the streamed poses and bake them into animation curves
+################################################################################
+def start_capture():
+    """
+    Call this function to keep every pose Mosketch streams during the session:
+        mosketch_for_maya.start_capture()
+    stop_capture() bakes them from the current frame.
+    """
+    global CAPTURE_TIMES
+    global CAPTURE_VALUES
+    global CAPTURE_NAMES
+    global CAPTURE_PLUGS
+    global CAPTURE_START
+    global CAPTURE_START_FRAME
+
+    CAPTURE_TIMES = array.array('d')
+    CAPTURE_VALUES = array.array('d')
+    CAPTURE_NAMES = None
+    CAPTURE_PLUGS = []
+    CAPTURE_START = time.time()
+    CAPTURE_START_FRAME = pmc.currentTime(query=True)
+    _print_success("capturing poses")
+
+
+def stop_capture(bake=True):
+    """
+    Call this function to stop capturing, and bake the captured poses unless bake is False:
+        mosketch_for_maya.stop_capture()
+    """
+    global CAPTURE_TIMES
+
+    if CAPTURE_TIMES is None:
+        return
+    if bake and len(CAPTURE_TIMES) > 0:
+        _bake_capture()
+    CAPTURE_TIMES = None
+    del CAPTURE_VALUES[:]
+
+
+def _capture_pose():
+    '''
+    Append the pose just applied: _read_pose reads 7 plugs per captured node (one asDouble each), then one array extend per frame.
+    '''
+    global CAPTURE_NAMES
+    global CAPTURE_PLUGS
+
+    if POSE_NAMES is None:
+        _build_pose_plan()
+    if CAPTURE_NAMES is None:
+        CAPTURE_NAMES = POSE_NAMES
+        CAPTURE_PLUGS = POSE_PLUGS
+    elif POSE_NAMES is not CAPTURE_NAMES:
+        # Mapping changed during the capture: the new layout cannot share its curves
+        _print_verbose("mapping changed, pose not captured", 2)
+        return
+
+    _read_pose(range(len(POSE_NAMES)))
+    CAPTURE_TIMES.append(time.time() - CAPTURE_START)
+    CAPTURE_VALUES.extend(POSE_RAW)
+
+
+def _bake_capture():
+    '''
+    Key the captured poses on rotate and translate of every captured node.
+    Captures are resampled to the scene frame rate (the last pose of a frame wins),
+    reduced if KEY_REDUCTION is on, then each channel gets its whole curve with one MFnAnimCurve.addKeys.
+    Locked channels and channels driven by something else than an anim curve are skipped.
+    Constant channels are skipped too, unless they already have an anim curve: their older keys in the baked range
+    are replaced by the constant.
+    '''
+    start_time = time.time()
+    time_unit = OpenMaya2.MTime.uiUnit()
+    fps = OpenMaya2.MTime(1.0, OpenMaya2.MTime.kSeconds).asUnits(time_unit)
+
+    # Frame of each capture, keep the last capture of each frame
+    frames = []
+    captures = []
+    for capture, capture_time in enumerate(CAPTURE_TIMES):
+        frame = CAPTURE_START_FRAME + int(round(capture_time * fps))
+        if frames and frames[-1] == frame:
+            captures[-1] = capture
+        else:
+            frames.append(frame)
+            captures.append(capture)
+
+    resampled = len(captures) != len(CAPTURE_TIMES)
+    stride = 7 * len(CAPTURE_NAMES)
+    stats = {"curves": 0, "skipped": 0, "keys": 0}
+    raw_keys = 0
+    max_angle = 0.0
+    max_distance = 0.0
+    reduce_time = 0.0
+    all_keys = range(len(frames))
+    for slot in range(len(CAPTURE_NAMES)):
+        base = slot * 7
+        # Extended slice: the whole channel in one C-level copy. rotateOrder is not keyed
+        columns = [CAPTURE_VALUES[base + channel::stride] for channel in range(6)]
+        if resampled:
+            columns = [[column[capture] for capture in captures] for column in columns]
+        # Same flip filter as mosketch_convert, so a rotation crossing +-180 deg gets the same continuous curve
+        _filter_euler_flips(columns[0], columns[1], columns[2], CAPTURE_VALUES[base + 6])
+        channels = [channel for channel in range(6) if max(columns[channel]) - min(columns[channel]) >= 1e-9]
+        raw_keys += len(channels) * len(frames)
+
+        # A constant needs two keys: first and last frame, flat in between
+        for channel in [channel for channel in range(6) if channel not in channels]:
+            if CAPTURE_PLUGS[base + channel].isDestination:
+                kept = sorted(set([0, len(frames) - 1]))
+                raw_keys += len(kept)
+                _key_channel(CAPTURE_PLUGS[base + channel], frames, columns[channel], kept, time_unit, stats, linear=True)
+
+        rotate_channels = [channel for channel in channels if channel < 3]
+        if rotate_channels:
+            kept = all_keys
+            if KEY_REDUCTION:
+                reduce_start = time.time()
+                kept, angle = mosketch_keyreduce.reduce_rotation(frames, columns[0], columns[1], columns[2],
+                                                                 CAPTURE_VALUES[base + 6], math.radians(KEY_ROTATION_TOLERANCE))
+                reduce_time += time.time() - reduce_start
+                max_angle = max(max_angle, angle)
+            for channel in rotate_channels:
+                _key_channel(CAPTURE_PLUGS[base + channel], frames, columns[channel], kept, time_unit, stats)
+
+        for channel in [channel for channel in channels if channel >= 3]:
+            kept = all_keys
+            if KEY_REDUCTION:
+                reduce_start = time.time()
+                kept, distance = mosketch_keyreduce.reduce_channel(frames, columns[channel], KEY_TRANSLATION_TOLERANCE)
+                reduce_time += time.time() - reduce_start
+                max_distance = max(max_distance, distance)
+            _key_channel(CAPTURE_PLUGS[base + channel], frames, columns[channel], kept, time_unit, stats)
+
+    _print_verbose("baked " + str(len(CAPTURE_TIMES)) + " poses into " + str(len(frames)) + " frames x " + str(stats["curves"]) + " curves ("
+                   + str(stats["skipped"]) + " locked or driven channels skipped) in " + "%.1f" % ((time.time() - start_time) * 1000.0) + " ms", 1)
+    if KEY_REDUCTION:
+        _print_verbose("key reduction: " + str(raw_keys) + " keys to " + str(stats["keys"]) + ", max error " + "%.3f" % math.degrees(max_angle)
+                       + " deg and " + "%.4f" % max_distance + " cm, in " + "%.1f" % (reduce_time * 1000.0) + " ms", 1)
+
+
+def _filter_euler_flips(rotate_x, rotate_y, rotate_z, rotate_order):
+    '''
+    Replace in place each rotation by mosketch_convert.get_closest_euler of it and the previous one.
+    A rotation within 45 deg of the previous one on every axis is left as is: get_closest_euler would return it unchanged.
+    '''
+    limit = math.pi / 4.0
+    previous = (rotate_x[0], rotate_y[0], rotate_z[0])
+    for index in range(1, len(rotate_x)):
+        angles = (rotate_x[index], rotate_y[index], rotate_z[index])
+        if abs(angles[0] - previous[0]) >= limit or abs(angles[1] - previous[1]) >= limit or abs(angles[2] - previous[2]) >= limit:
+            angles = mosketch_convert.get_closest_euler(angles, previous, rotate_order)
+            rotate_x[index], rotate_y[index], rotate_z[index] = angles
+        previous = angles
+
+
+def _key_channel(plug, frames, values, kept, time_unit, stats, linear=False):
+    curve = _get_anim_curve(plug)
+    if curve is None:
+        stats["skipped"] += 1
+        return
+    key_times = OpenMaya2.MTimeArray([OpenMaya2.MTime(frames[index], time_unit) for index in kept])
+    key_values = OpenMaya2.MDoubleArray([values[index] for index in kept])
+    if linear or KEY_REDUCTION:
+        # The reduction tolerance holds for linear interpolation between the kept keys
+        tangent = OpenMayaAnim2.MFnAnimCurve.kTangentLinear
+    else:
+        tangent = OpenMayaAnim2.MFnAnimCurve.kTangentGlobal
+    curve.addKeys(key_times, key_values, tangent, tangent, keepExistingKeys=False)
+    stats["curves"] += 1
+    stats["keys"] += len(kept)
+
+
+def _get_anim_curve(plug):
+    '''
+    Return the anim curve of plug, created if the plug is free. None if it cannot be keyed.
+    '''
+    if plug.isLocked:
+        return None
+    if plug.isDestination:
+        source = plug.source().node()
+        if not source.hasFn(OpenMaya2.MFn.kAnimCurve):
+            return None
+        return OpenMayaAnim2.MFnAnimCurve(source)
+    curve = OpenMayaAnim2.MFnAnimCurve()
+    curve.create(plug)
+    return curve
+
+
+def benchmark_bake_capture(nb_frames=5000, nb_joints=300):
+    """
+    Time the bake of a synthetic capture, without then with key reduction.
+    Call it from Maya's script editor (it creates its own joints, then deletes them and their curves):
+        mosketch_for_maya.benchmark_bake_capture()
+    Every joint rotates on its 3 axes, the first one also translates: nb_joints * 3 + 3 curves of nb_frames keys.
+    """
+    global CAPTURE_TIMES
+    global CAPTURE_NAMES
+    global CAPTURE_PLUGS
+    global CAPTURE_START_FRAME
+    global KEY_REDUCTION
+
+    if CAPTURE_TIMES is not None:
+        _print_error("stop the capture before the benchmark.")
+        return
+
+    key_reduction = KEY_REDUCTION
+    fps = OpenMaya2.MTime(1.0, OpenMaya2.MTime.kSeconds).asUnits(OpenMaya2.MTime.uiUnit())
+    nodes = [pmc.createNode("joint", name="mosketchBenchmark" + str(index)) for index in range(nb_joints)]
+    timings = []
+    try:
+        CAPTURE_NAMES = ["Joint" + str(index) + "_M" for index in range(nb_joints)]
+        CAPTURE_PLUGS = _get_pose_plugs(nodes)
+        CAPTURE_TIMES = array.array('d', [frame / fps for frame in range(nb_frames)])
+        CAPTURE_START_FRAME = 0.0
+        del CAPTURE_VALUES[:]
+        CAPTURE_VALUES.extend(array.array('d', [0.0]) * (7 * nb_joints * nb_frames))
+        stride = 7 * nb_joints
+        for slot in range(nb_joints):
+            for channel in range(3):
+                CAPTURE_VALUES[slot * 7 + channel::stride] = array.array('d', [0.5 * math.sin(frame * 0.01 * (channel + 1) + slot) for frame in range(nb_frames)])
+        for channel in range(3, 6):
+            CAPTURE_VALUES[channel::stride] = array.array('d', [20.0 * math.sin(frame * 0.005 * channel) for frame in range(nb_frames)])
+
+        for reduction in (False, True):
+            KEY_REDUCTION = reduction
+            start_time = time.time()
+            _bake_capture()
+            timings.append(time.time() - start_time)
+            # Both runs create their curves
+            curves = cmds.listConnections([node.longName() for node in nodes], type="animCurve", source=True, destination=False) or []
+            if curves:
+                cmds.delete(curves)
+    finally:
+        KEY_REDUCTION = key_reduction
+        CAPTURE_TIMES = None
+        del CAPTURE_VALUES[:]
+        cmds.delete([node.longName() for node in nodes])
+
+    _print_verbose("bake " + str(nb_frames) + " frames x " + str(nb_joints) + " joints: " + "%.2f" % timings[0] + " s, "
+                   + "%.2f" % timings[1] + " s with key reduction", 1)
+    return timings
+
+
+################################################################################
+# Offline conversion of takes (see mosketch_convert.py)
+################################################################################
+def export_rest_data(file_path):
+    """
+    Call this function once Mosketch is connected to write what mosketch_convert.py needs to pose the character:
+        mosketch_for_maya.export_rest_data("C:/rigs/hero_rest.json")
+    """
+    if not JOINTS_BUFFER:
+        _print_error("connect to Mosketch first: rest data comes from the mapped hierarchy.")
+        return
+
+    if RIG["controllers"]:
+        maya_buffer = CONTROLLERS_BUFFER
+        rotate_axis_inv_buffer = CONTROLLERS_ROTATE_AXIS_INV_BUFFER
+        orient_inv_buffer = CONTROLLERS_INIT_ORIENT_INV_BUFFER
+    else:
+        maya_buffer = JOINTS_BUFFER
+        rotate_axis_inv_buffer = JOINTS_ROTATE_AXIS_INV_BUFFER
+        orient_inv_buffer = JOINTS_INIT_ORIENT_INV_BUFFER
+
+    joints = {}
+    for joint_name, maya_node in maya_buffer.items():
+        rest = {
+            "node": maya_node.longName(),
+            "rotate_axis_inv": list(rotate_axis_inv_buffer[joint_name]),
+            "joint_orient_inv": list(orient_inv_buffer[joint_name]),
+            "rotate_order": cmds.getAttr(maya_node.longName() + ".rotateOrder"),
+        }
+        if joint_name == RIG["root_controller"] and RIG["root_offset"] in ROOTS_SYSTEM and RIG["root_pre_transform"] in ROOTS_SYSTEM:
+            oT, oJO = _get_root_offsets()
+            rest["root_pre_transform"] = [oJO.x, oJO.y, oJO.z, oJO.w]
+            rest["root_offset"] = [oT[0], oT[1], oT[2]]
+        joints[joint_name] = rest
+
+    with open(file_path, "w") as rest_stream:
+        json.dump({"version": REST_DATA_VERSION, "model": MODEL_NAME, "joints": joints}, rest_stream, indent=1, sort_keys=True)
+    _print_success(str(len(joints)) + " joints rest data written to " + file_path)
+
+
+def import_baked_curves(file_path, start_frame=None):
+    """
+    Call this function to key a curves file written by mosketch_convert.py, from the current frame by default:
+        mosketch_for_maya.import_baked_curves("C:/sessions/curves/take01.curves.json")
+    """
+    start_time = time.time()
+    with open(file_path, "r") as curves_stream:
+        baked = json.load(curves_stream)
+    if baked.get("format") != CURVES_FORMAT or baked.get("version") != CURVES_VERSION:
+        _print_error(file_path + " is not a curves file of version " + str(CURVES_VERSION))
+        return
+
+    if start_frame is None:
+        start_frame = pmc.currentTime(query=True)
+    time_unit = OpenMaya2.MTime.uiUnit()
+    frame_scale = OpenMaya2.MTime(1.0, OpenMaya2.MTime.kSeconds).asUnits(time_unit) / baked["fps"]
+    stats = {"curves": 0, "skipped": 0, "keys": 0}
+    missing = 0
+    for attribute_name, curve_data in baked["curves"].items():
+        selection = OpenMaya2.MSelectionList()
+        try:
+            selection.add(attribute_name)
+        except RuntimeError:
+            missing += 1
+            continue
+        frames = [start_frame + frame * frame_scale for frame in curve_data["frames"]]
+        _key_channel(selection.getPlug(0), frames, curve_data["values"], range(len(frames)), time_unit, stats)
+
+    _print_verbose("imported " + str(stats["keys"]) + " keys on " + str(stats["curves"]) + " curves (" + str(missing) + " missing and "
+                   + str(stats["skipped"]) + " locked or driven attributes) in " + "%.1f" % ((time.time() - start_time) * 1000.0) + " ms", 1)
+
+
+################################################################################
+# Replay a recorded session without Mosketch
+################################################################################
+class _ReplayConnection(object):
+    '''
+    Stands for CONNECTION without Mosketch (replay, takes): what the bridge sends back is only counted.
+    '''
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def replay_session(file_path, speed=1.0, refresh=False):
+    """
+    Call this function to feed a session log (see start_recording) to the bridge as if Mosketch was sending it:
+        mosketch_for_maya.replay_session("C:/sessions/session.msklog", speed=2.0)
+        speed 1.0 keeps the recorded timing, 2.0 is twice as fast, 0 replays as fast as possible.
+        refresh redraws the viewport after each frame (to include its cost).
+    Reports frames per second, JointsStream latency percentiles and a checksum of the final pose.
+    Only the first session of the log is replayed (sessions appended to a log restart their clock at 0).
+    The replay keeps its latency samples apart: the session latency (see export_latency) is left as it was.
+    """
+    global CONNECTION
+    global RECORDER
+    global LATENCY_SAMPLES
+    global LATENCY_HISTOGRAMS
+
+    if CONNECTION is not None:
+        _print_error("close the connection to Mosketch before replaying a session.")
+        return
+
+    _initial_settings()
+    connection = _ReplayConnection()
+    CONNECTION = connection
+    recorder = RECORDER
+    RECORDER = None # Do not record the replay
+    latency = (LATENCY_SAMPLES, LATENCY_HISTOGRAMS)
+    LATENCY_SAMPLES = dict([(kind, collections.deque(maxlen=LATENCY_WINDOW)) for kind in latency[0]])
+    LATENCY_HISTOGRAMS = dict([(kind, array.array('L', [0]) * LATENCY_BUCKETS) for kind in latency[1]])
+    hierarchy_time = 0.0
+    latencies = []
+    late_frames = 0
+    previous_timestamp = -1.0
+    try:
+        start_time = mosketch_session_log.clock()
+        for timestamp, packet in mosketch_session_log.read_log(file_path):
+            if timestamp < previous_timestamp:
+                _print_verbose("replay stops at the next session appended to " + file_path, 1)
+                break
+            previous_timestamp = timestamp
+            if speed:
+                wait_time = timestamp / speed - (mosketch_session_log.clock() - start_time)
+                if wait_time > 0:
+                    time.sleep(wait_time)
+                elif wait_time < -0.001:
+                    late_frames += 1
+            if CONNECTION is None:
+                break # The replayed session closed the connection (mapping failed...)
+            packet_start = mosketch_session_log.clock()
+            _process_data(packet)
+            packet_time = mosketch_session_log.clock() - packet_start
+            if b'"JointsStream"' in packet:
+                latencies.append(packet_time)
+                if refresh:
+                    cmds.refresh(force=True)
+            elif b'"Hierarchy"' in packet:
+                hierarchy_time += packet_time
+        total_time = mosketch_session_log.clock() - start_time
+        checksum = _get_pose_checksum() if CONNECTION is not None else "none (not mapped)"
+    except (IOError, mosketch_session_log.LogError) as e:
+        _print_error("cannot replay " + file_path + " (" + str(e) + ")")
+        return
+    finally:
+        RECORDER = recorder
+        LATENCY_SAMPLES, LATENCY_HISTOGRAMS = latency
+        if CONNECTION is connection:
+            _close_connection()
+
+    latencies.sort()
+    print "Replayed " + file_path + " at " + (str(speed) + "x" if speed else "full speed")
+    print "    " + str(len(latencies)) + " frames in " + "%.2f" % total_time + " s: " + "%.1f" % (len(latencies) / max(total_time, 0.000001)) + " fps, " + str(late_frames) + " late"
+    if latencies:
+        print "    frame latency ms: " + ", ".join([label + " " + "%.2f" % (_get_percentile(latencies, fraction) * 1000.0)
+                                                   for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))])
+    print "    hierarchy " + "%.1f" % (hierarchy_time * 1000.0) + " ms, " + str(connection.bytes) + " bytes sent back"
+    print "    pose checksum " + checksum
+
+
+################################################################################
+# Scrub a take (see mosketch_takes)
+################################################################################
+def open_take(file_path, scrub=True):
+    """
+    Call this function to pose the character from a take file, starting at the current frame:
+        mosketch_for_maya.open_take("C:/sessions/take.msktake")
+        scrub applies the take frame matching the time slider whenever the time changes.
+    Without Mosketch connected, the take's Hierarchy is mapped as if Mosketch had sent it.
+    """
+    global TAKE
+    global TAKE_START_FRAME
+    global TAKE_FRAME_SCALE
+    global TAKE_CALLBACK
+    global CONNECTION
+
+    if TAKE is not None:
+        close_take()
+    try:
+        TAKE = mosketch_takes.Take(file_path)
+    except (IOError, mosketch_takes.TakeError) as e:
+        _print_error("cannot open take " + file_path + " (" + str(e) + ")")
+        return
+
+    try:
+        if CONNECTION is None:
+            _initial_settings()
+            CONNECTION = _ReplayConnection()
+            _process_hierarchy({JSON_KEY_TYPE: "Hierarchy", JSON_KEY_JOINTS: TAKE.joints_name})
+            if CONNECTION is None:
+                close_take()
+                return
+
+        scene_fps = OpenMaya2.MTime(1.0, OpenMaya2.MTime.kSeconds).asUnits(OpenMaya2.MTime.uiUnit())
+        TAKE_FRAME_SCALE = TAKE.fps / scene_fps
+        TAKE_START_FRAME = pmc.currentTime(query=True)
+        if scrub:
+            TAKE_CALLBACK = OpenMaya.MEventMessage.addEventCallback("timeChanged", _take_time_changed)
+        apply_take_frame(0)
+    except Exception as e:
+        # Leave neither a half opened take nor the stand-in connection behind
+        close_take()
+        _print_error("cannot open take " + file_path + " (" + type(e).__name__ + ": " + str(e) + ")")
+        return
+    _print_success("take " + file_path + ": " + str(TAKE.frame_count) + " frames at " + str(TAKE.fps) + " fps")
+
+
+def close_take():
+    """
+    Call this function to stop scrubbing the take:
+        mosketch_for_maya.close_take()
+    """
+    global TAKE
+    global TAKE_CALLBACK
+
+    if TAKE_CALLBACK is not None:
+        OpenMaya.MMessage.removeCallback(TAKE_CALLBACK)
+        TAKE_CALLBACK = None
+    if TAKE is not None:
+        TAKE.close()
+        TAKE = None
+    if isinstance(CONNECTION, _ReplayConnection):
+        _close_connection()
+
+
+def apply_take_frame(frame):
+    """
+    Pose the character with frame of the opened take. Same cost whatever the take length:
+    the frame is one slice of the mapped file, applied through the JointsStream path.
+    """
+    if TAKE is None:
+        _print_error("no take opened.")
+        return
+    frame = min(max(frame, 0), TAKE.frame_count - 1)
+    values = TAKE.get_frame(frame)
+    joints_data = []
+    for slot, joint_name in enumerate(TAKE.joints_name):
+        base = slot * 7
+        # NaN (never equal to itself) marks values not streamed
+        if values[base + 3] != values[base + 3]:
+            continue
+        translation = list(values[base + 4:base + 7])
+        joints_data.append({
+            JSON_KEY_NAME: joint_name,
+            JSON_KEY_ROTATION: list(values[base:base + 4]),
+            JSON_KEY_TRANSLATION: translation,
+            JSON_KEY_ANATOMIC: 7 if translation[0] == translation[0] else 0,
+        })
+    _process_joints_stream({JSON_KEY_TYPE: "JointsStream", JSON_KEY_JOINTS: joints_data})
+
+
+def _take_time_changed(*args):
+    try:
+        apply_take_frame(int(round((pmc.currentTime(query=True) - TAKE_START_FRAME) * TAKE_FRAME_SCALE)))
+    except Exception as e:
+        _print_error("cannot apply take frame (" + type(e).__name__ + ": " + str(e) + ")")
+
+
+def _get_percentile(sorted_values, fraction):
+    # Nearest rank
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def _get_pose_checksum():
+    '''
+    Hash of every mapped node's rotate, translate and rotateOrder, rounded so that identical replays give identical checksums.
+    '''
+    if POSE_NAMES is None:
+        _build_pose_plan()
+    _read_pose(range(len(POSE_NAMES)))
+    pose = ";".join([joint_name + ":" + ",".join(["%.4f" % value for value in POSE_RAW[slot * 7:slot * 7 + 7]])
+                     for slot, joint_name in enumerate(POSE_NAMES)])
+    return hashlib.sha1(pose.encode("utf-8")).hexdigest()[:16]
+
+
 ################################################################################
 # Class definition for UI
 ################################################################################
@@ -212,6 +1096,15 @@ class UI_MosketchWindow(QtWidgets.QMainWindow):
         update_mosketch_button.setCheckable(False)
         update_mosketch_button.clicked.connect(_update_mosketch)
         buttons_layout.addWidget(update_mosketch_button)
+        self.live_button = QtWidgets.QToolButton(content)
+        self.live_button.setText("LIVE")
+        self.live_button.setCheckable(True)
+        self.live_button.toggled.connect(_toggle_live_mode)
+        buttons_layout.addWidget(self.live_button)
+        timeline_button = QtWidgets.QToolButton(content)
+        timeline_button.setText("SEND TIMELINE")
+        timeline_button.clicked.connect(_send_playback_range)
+        buttons_layout.addWidget(timeline_button)
 
         spacer = QtWidgets.QSpacerItem(10, 20)
 
@@ -219,6 +1112,18 @@ class UI_MosketchWindow(QtWidgets.QMainWindow):
         self.status_text.setWordWrap(True)
         self.status_text.setText("Not connected yet")
 
+        latency_layout = QtWidgets.QHBoxLayout()
+        self.latency_text = QtWidgets.QLabel(content)
+        self.latency_text.setText(_get_latency_text())
+        latency_layout.addWidget(self.latency_text)
+        export_latency_button = QtWidgets.QToolButton(content)
+        export_latency_button.setText("EXPORT LATENCY")
+        export_latency_button.clicked.connect(self.export_latency)
+        latency_layout.addWidget(export_latency_button)
+        self.latency_timer = QtCore.QTimer(self)
+        self.latency_timer.timeout.connect(self.refresh_latency)
+        self.latency_timer.start(LATENCY_REFRESH_MS)
+
         content.setLayout(main_layout)
         main_layout.addWidget(help_text)
         main_layout.addLayout(ip_layout)
@@ -226,6 +1131,17 @@ class UI_MosketchWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(content)
         main_layout.addSpacerItem(spacer)
         main_layout.addWidget(self.status_text)
+        main_layout.addLayout(latency_layout)
+
+    def refresh_latency(self):
+        self.latency_text.setText(_get_latency_text())
+
+    def export_latency(self):
+        file_path = QtWidgets.QFileDialog.getSaveFileName(self, "Export latency", "", "Json (*.json)")
+        if isinstance(file_path, tuple):
+            file_path = file_path[0] # Qt5 bindings also return the filter
+        if file_path:
+            export_latency(file_path)
 
     def closeEvent(self, event):
         # Close connection if any is still opened
@@ -285,12 +1201,15 @@ def _ip_text_changed(text):
 def _print_error(error):
     error_msg = "ERROR: " + error
     print error_msg
-    MAIN_WINDOW.status_text.setText(error_msg)
+    # No window during a replay from the script editor
+    if MAIN_WINDOW is not None:
+        MAIN_WINDOW.status_text.setText(error_msg)
 
 def _print_success(success):
     success_msg = "SUCCESS: " + success
     print success_msg
-    MAIN_WINDOW.status_text.setText(success_msg)
+    if MAIN_WINDOW is not None:
+        MAIN_WINDOW.status_text.setText(success_msg)
 
 def _print_encoding(string):
     if isinstance(string, str):
@@ -305,6 +1224,12 @@ def _print_verbose(msg, verbose_level):
     if verbose_level <= VERBOSE:
         print(msg)
 
+def _print_timings(title, timings):
+    # timings is a list of (phase, seconds)
+    total = sum([duration for phase, duration in timings])
+    details = ", ".join([phase + " " + "%.1f" % (duration * 1000.0) + " ms" for phase, duration in timings])
+    _print_verbose(title + ": " + "%.1f" % (total * 1000.0) + " ms (" + details + ")", 1)
+
 ################################################################################
 ##########          CONNECTION
 ################################################################################
@@ -350,6 +1275,8 @@ def _close_connection():
     global JOINTS_BUFFER
     global JOINTS_INIT_ORIENT_INV_BUFFER
     global JOINTS_ROTATE_AXIS_INV_BUFFER
+    global JOINTS_INIT_ORIENT_BUFFER
+    global JOINTS_ROTATE_AXIS_BUFFER
 
     if CONNECTION is None:
         _print_error("connection is already closed.")
@@ -357,11 +1284,18 @@ def _close_connection():
 
     CONNECTION.close()
     CONNECTION = None
+    _stop_live_mode()
+    _remove_rest_callbacks()
+    _remove_maya_uuid_callbacks()
+    _reset_pose_plan()
     JOINTS_BUFFER = {}
     JOINTS_INIT_ORIENT_INV_BUFFER = {}
     JOINTS_ROTATE_AXIS_INV_BUFFER = {}
+    JOINTS_INIT_ORIENT_BUFFER = {}
+    JOINTS_ROTATE_AXIS_BUFFER = {}
 
 def _connected():
+    _reset_latency()
     _print_success("connection opened on " + _get_connection_name())
 
 def _disconnected():
@@ -400,109 +1334,512 @@ def _update_mosketch():
         _print_error("Mosketch is not connected!")
         return
 
-    if ((MODEL_NAME == "Mosko_Rigged") or (MODEL_NAME == "DeepSea_Rigged")):
-        _update_mosketch_from_controllers()
-        return
+    _send_pose()
 
-    # For every joint, pack data, then send packet
+
+################################################################################
+##########          SEND POSE
+################################################################################
+def _send_pose(joints_name=None):
+    '''
+    Send the given Mosketch joints (all mapped joints by default).
+    Rigged models send their controllers.
+    '''
     try:
-        quat = pmc.datatypes.Quaternion()
-        joints_buffer_values = JOINTS_BUFFER.values()
+        if POSE_NAMES is None:
+            _build_pose_plan()
+
+        if joints_name is None:
+            slots = range(len(POSE_NAMES))
+        else:
+            slots = [POSE_SLOTS[joint_name] for joint_name in joints_name if joint_name in POSE_SLOTS]
+
+        _read_pose(slots)
+        _pose_to_mosketch(slots)
+        if not _check_finite_pose(slots):
+            return
+
+        del POSE_BUFFER[:]
+        if joints_name is None:
+            _encode_full_joints_stream(POSE_BUFFER, POSE_JOINTS_FORMAT, POSE_VALUES, sequence=_next_stream_sequence())
+        else:
+            _encode_joints_stream(POSE_BUFFER, POSE_PREFIXES, POSE_VALUES, slots, sequence=_next_stream_sequence())
+        CONNECTION.write(bytes(POSE_BUFFER))
+    except Exception, e:
+        _print_error("cannot send joint value (" + str(e) + ")")
+
+
+def _check_finite_pose(slots, report=True):
+    '''
+    True if POSE_VALUES of slots are all finite. A NaN or an infinity (a broken plug) would make the whole packet unparsable.
+    '''
+    values = POSE_VALUES
+    if len(slots) == len(POSE_NAMES):
+        total = sum(values)
+    else:
+        total = sum([sum(values[slot * 7:slot * 7 + 7]) for slot in slots])
+    # Any NaN or infinity makes the sum non-finite, and x - x is 0 only for finite x
+    if total - total == 0.0:
+        return True
+
+    names = [POSE_NAMES[slot] for slot in slots if [value for value in values[slot * 7:slot * 7 + 7] if value - value != 0.0]]
+    message = "non-finite values on " + ", ".join(names) + ", JointsStream not sent"
+    if report:
+        _print_error(message)
+    else:
+        _print_verbose(message, 2)
+    return False
+
+
+################################################################################
+##########          JointsStream encoder
+################################################################################
+def _encode_joint_prefix(joint_name):
+    return b'{"' + JSON_KEY_NAME.encode("ascii") + b'":' + json.dumps(joint_name).encode("ascii") + b',"' + JSON_KEY_ROTATION.encode("ascii") + b'":['
+
+
+def _encode_joints_stream(buffer, prefixes, values, slots, frame=None, sequence=None):
+    '''
+    Append a JointsStream packet to buffer, straight from the pose values (7 per slot), which must be finite.
+    Same Json as json.dumps of the {"Type", "Joints": [{"Name", "LR", "LT"}]} dicts, without building them.
+    sequence is an optional (Seq, SentAt) pair (see _next_stream_sequence).
+    '''
+    buffer += JOINTS_STREAM_HEADER
+    if sequence is not None:
+        buffer += JOINTS_STREAM_SEQUENCE_FORMAT % sequence
+    if frame is not None:
+        buffer += JOINTS_STREAM_FRAME_FORMAT % frame
+    buffer += JOINTS_STREAM_JOINTS
+    separator = False
+    for slot in slots:
+        if separator:
+            buffer += b','
+        base = slot * 7
+        buffer += prefixes[slot]
+        buffer += JOINT_VALUES_FORMAT % (values[base], values[base + 1], values[base + 2], values[base + 3], values[base + 4], values[base + 5], values[base + 6])
+        separator = True
+    buffer += b']}'
+    return buffer
+
+
+def _encode_joints_format(prefixes):
+    # Joint names are escaped as they end up in a format string
+    return JOINTS_STREAM_JOINTS + b','.join([prefix.replace(b'%', b'%%') + JOINT_VALUES_FORMAT for prefix in prefixes]) + b']}'
+
+
+def _encode_full_joints_stream(buffer, joints_format, values, frame=None, sequence=None):
+    '''
+    Append a JointsStream packet of every slot to buffer: one format operation for the whole packet.
+    '''
+    buffer += JOINTS_STREAM_HEADER
+    if sequence is not None:
+        buffer += JOINTS_STREAM_SEQUENCE_FORMAT % sequence
+    if frame is not None:
+        buffer += JOINTS_STREAM_FRAME_FORMAT % frame
+    buffer += joints_format % tuple(values)
+    return buffer
+
+
+def benchmark_joints_stream_encoder(nb_joints=300, nb_iterations=200):
+    """
+    Compare the JointsStream encoder with building dicts then calling json.dumps.
+    Call it from Maya's script editor:
+        mosketch_for_maya.benchmark_joints_stream_encoder()
+    """
+    names = ["Joint" + str(index) + "_M" for index in range(nb_joints)]
+    prefixes = [_encode_joint_prefix(joint_name) for joint_name in names]
+    values = array.array('d', [0.123456789 * (index % 11) - 0.5 for index in range(7 * nb_joints)])
+    slots = range(nb_joints)
+
+    start_time = time.time()
+    for iteration in range(nb_iterations):
         joints_stream = {}
         joints_stream[JSON_KEY_TYPE] = "JointsStream"
         joints_stream[JSON_KEY_JOINTS] = []
-        for maya_joint in joints_buffer_values:
+        for slot in slots:
+            base = slot * 7
             joint_data = {} # Reinit it
-            joint_name = maya_joint.name()
+            joint_data[JSON_KEY_NAME] = names[slot]
+            joint_data[JSON_KEY_ROTATION] = [values[base], values[base + 1], values[base + 2], values[base + 3]]
+            joint_data[JSON_KEY_TRANSLATION] = [values[base + 4], values[base + 5], values[base + 6]]
+            joints_stream[JSON_KEY_JOINTS].append(joint_data)
+        json_data = json.dumps(joints_stream)
+    dict_time = time.time() - start_time
+
+    buffer = bytearray()
+    start_time = time.time()
+    for iteration in range(nb_iterations):
+        del buffer[:]
+        _encode_joints_stream(buffer, prefixes, values, slots)
+    encoder_time = time.time() - start_time
+    joints_packet = bytes(buffer)
+
+    joints_format = _encode_joints_format(prefixes)
+    start_time = time.time()
+    for iteration in range(nb_iterations):
+        del buffer[:]
+        _encode_full_joints_stream(buffer, joints_format, values)
+    full_encoder_time = time.time() - start_time
+
+    # All of them must decode to the very same packet
+    expected = json.loads(json_data)
+    if json.loads(joints_packet.decode("ascii")) != expected or json.loads(bytes(buffer).decode("ascii")) != expected:
+        _print_verbose("ERROR: encoder output differs from json.dumps", 1)
+
+    _print_verbose("JointsStream " + str(nb_joints) + " joints, ms per packet: dicts + json.dumps " + "%.3f" % (dict_time * 1000.0 / nb_iterations)
+                   + ", encoder (per joint) " + "%.3f" % (encoder_time * 1000.0 / nb_iterations)
+                   + ", encoder (full pose) " + "%.3f" % (full_encoder_time * 1000.0 / nb_iterations), 1)
+    return dict_time, encoder_time, full_encoder_time
+
+
+################################################################################
+##########          Bulk pose readback
+################################################################################
+def _build_pose_plan():
+    '''
+    Resolve once per mapping everything the send path needs: plugs, rest quaternions and arrays.
+    '''
+    global POSE_NAMES
+    global POSE_SLOTS
+    global POSE_PLUGS
+    global POSE_REST
+    global POSE_ROOT_SLOT
+    global POSE_ROOT_PLUGS
+    global POSE_RAW
+    global POSE_VALUES
+    global POSE_PREFIXES
+    global POSE_JOINTS_FORMAT
+
+    from_controllers = RIG["controllers"]
+    if from_controllers:
+        maya_buffer = CONTROLLERS_BUFFER
+        rotate_axis_buffer = CONTROLLERS_ROTATE_AXIS_BUFFER
+        init_orient_buffer = CONTROLLERS_INIT_ORIENT_BUFFER
+    else:
+        maya_buffer = JOINTS_BUFFER
+        rotate_axis_buffer = JOINTS_ROTATE_AXIS_BUFFER
+        init_orient_buffer = JOINTS_INIT_ORIENT_BUFFER
+
+    names = list(maya_buffer.keys())
+    POSE_SLOTS = dict((joint_name, slot) for slot, joint_name in enumerate(names))
+    POSE_PLUGS = _get_pose_plugs([maya_buffer[joint_name] for joint_name in names])
+    POSE_REST = [(_to_api2_quaternion(rotate_axis_buffer[joint_name]), _to_api2_quaternion(init_orient_buffer[joint_name])) for joint_name in names]
+    POSE_ROOT_SLOT = POSE_SLOTS.get(RIG["root_controller"], -1) if RIG["root_controller"] and RIG["root_send_offsets"] else -1
+    POSE_ROOT_PLUGS = []
+    if POSE_ROOT_SLOT >= 0:
+        if RIG["root_offset"] in ROOTS_SYSTEM and RIG["root_pre_transform"] in ROOTS_SYSTEM:
+            root_plugs = _get_pose_plugs([ROOTS_SYSTEM[RIG["root_offset"]], ROOTS_SYSTEM[RIG["root_pre_transform"]]])
+            POSE_ROOT_PLUGS = root_plugs[3:6] + root_plugs[7:10] + root_plugs[13:14]
+        else:
+            _print_verbose("WARNING: root offsets not found, " + RIG["root_controller"] + " is sent without them", 1)
+            POSE_ROOT_SLOT = -1
+    POSE_RAW = array.array('d', [0.0]) * (7 * len(names))
+    POSE_VALUES = array.array('d', [0.0]) * (7 * len(names))
+    POSE_PREFIXES = [_encode_joint_prefix(joint_name) for joint_name in names]
+    POSE_JOINTS_FORMAT = _encode_joints_format(POSE_PREFIXES)
+    POSE_NAMES = names
+    _print_verbose("pose plan: " + str(len(names)) + " slots", 2)
+
+
+def _reset_pose_plan():
+    global POSE_NAMES
+    POSE_NAMES = None
+
+
+def _to_api2_quaternion(quat):
+    return OpenMaya2.MQuaternion(quat[0], quat[1], quat[2], quat[3])
+
+
+def _get_pose_plugs(maya_nodes):
+    '''
+    Returns a flat list of API 2.0 plugs, 7 per node: rx, ry, rz, tx, ty, tz, rotateOrder
+    '''
+    selection = OpenMaya2.MSelectionList()
+    for maya_node in maya_nodes:
+        selection.add(maya_node.longName())
+
+    pose_plugs = []
+    for index in range(len(maya_nodes)):
+        node_fn = OpenMaya2.MFnDependencyNode(selection.getDependNode(index))
+        for attribute_name in ("rotateX", "rotateY", "rotateZ", "translateX", "translateY", "translateZ", "rotateOrder"):
+            pose_plugs.append(node_fn.findPlug(attribute_name, False))
+    return pose_plugs
+
+
+def _read_pose(slots, context=None):
+    '''
+    Read rotate, translate and rotateOrder of the given slots into POSE_RAW, and the root offsets into POSE_ROOT_RAW
+    with the root slot (they may be animated too).
+    context is an optional API 2.0 MDGContext (evaluate at another time).
+    '''
+    previous_context = None
+    if context is not None and hasattr(context, "makeCurrent"):
+        # Maya 2019+: evaluation context is made current instead of being passed to every get
+        previous_context = context.makeCurrent()
+        context = None
+
+    plugs = POSE_PLUGS
+    raw = POSE_RAW
+    try:
+        for slot in slots:
+            for index in range(slot * 7, slot * 7 + 7):
+                if context is None:
+                    raw[index] = plugs[index].asDouble()
+                else:
+                    raw[index] = plugs[index].asDouble(context)
+        if POSE_ROOT_SLOT >= 0 and POSE_ROOT_SLOT in slots:
+            for index, plug in enumerate(POSE_ROOT_PLUGS):
+                if context is None:
+                    POSE_ROOT_RAW[index] = plug.asDouble()
+                else:
+                    POSE_ROOT_RAW[index] = plug.asDouble(context)
+    finally:
+        if previous_context is not None:
+            previous_context.makeCurrent()
+
+
+def _pose_to_mosketch(slots):
+    '''
+    Convert POSE_RAW to the "full" local rotations and translations Mosketch expects (POSE_VALUES).
+    '''
+    raw = POSE_RAW
+    values = POSE_VALUES
+    for slot in slots:
+        base = slot * 7
+        quat = OpenMaya2.MEulerRotation(raw[base], raw[base + 1], raw[base + 2], int(raw[base + 6])).asQuaternion()
+        tx = raw[base + 3]
+        ty = raw[base + 4]
+        tz = raw[base + 5]
+
+        # W = [S] * [RO] * [R] * [JO] * [IS] * [T]
+        RO, JO = POSE_REST[slot]
+        if slot == POSE_ROOT_SLOT:
+            # Root offsets read by _read_pose, at the same time as the slots
+            root_raw = POSE_ROOT_RAW
+            oJO = OpenMaya2.MEulerRotation(root_raw[3], root_raw[4], root_raw[5], int(root_raw[6])).asQuaternion()
+            quat = oJO * RO * quat * JO * oJO.inverse()
+            tx += root_raw[0]
+            ty += root_raw[1]
+            tz += root_raw[2]
+        else:
+            quat = RO * quat * JO
+
+        values[base] = quat.x
+        values[base + 1] = quat.y
+        values[base + 2] = quat.z
+        values[base + 3] = quat.w
+        # Mosketch uses meters. Maya uses centimeters
+        values[base + 4] = tx * 0.01
+        values[base + 5] = ty * 0.01
+        values[base + 6] = tz * 0.01
+
+
+def _get_root_offsets():
+    '''
+    The rigged root controller (RootX_M) has a translation offset and a pre transform.
+    '''
+    offset = ROOTS_SYSTEM[RIG["root_offset"]]
+    oT = offset.getTranslation(space='transform')
+    offset = ROOTS_SYSTEM[RIG["root_pre_transform"]]
+    oJO = offset.getRotation(space='transform', quaternion=True)
+    return oT, _to_api2_quaternion(oJO)
+
+
+################################################################################
+##########          SEND TIMELINE
+################################################################################
+def _send_playback_range():
+    start_frame = pmc.playbackOptions(query=True, minTime=True)
+    end_frame = pmc.playbackOptions(query=True, maxTime=True)
+    _send_timeline(start_frame, end_frame)
+
+
+def _send_timeline(start_frame, end_frame, batch_size=TIMELINE_BATCH_SIZE):
+    '''
+    Send the animation of the mapped joints (or controllers) from start_frame to end_frame.
+    Frames are evaluated through a time context, so Maya's current time never moves.
+    We write batch_size JointsStream packets at once (as a Json array, like buffered commands).
+    Each packet carries its frame number.
+    '''
+    if CONNECTION is None:
+        _print_error("Mosketch is not connected!")
+        return
+
+    try:
+        start_time = time.time()
+        if POSE_NAMES is None:
+            _build_pose_plan()
+        slots = range(len(POSE_NAMES))
+        time_unit = OpenMaya2.MTime.uiUnit()
+
+        nb_frames = 0
+        nb_packets = 0
+        nb_skipped = 0
+        frame = start_frame
+        while frame <= end_frame:
+            _read_pose(slots, OpenMaya2.MDGContext(OpenMaya2.MTime(frame, time_unit)))
+            _pose_to_mosketch(slots)
+            if not _check_finite_pose(slots, report=False):
+                nb_skipped += 1
+                frame += 1
+                continue
+
+            if nb_packets == 0:
+                del POSE_BUFFER[:]
+                POSE_BUFFER.extend(b'[')
+            else:
+                POSE_BUFFER.extend(b',')
+            # No sequence: Mosketch does not ack timeline frames, they must not wait in STREAM_SENT_TIMES
+            _encode_full_joints_stream(POSE_BUFFER, POSE_JOINTS_FORMAT, POSE_VALUES, frame)
+            nb_packets += 1
+            nb_frames += 1
+
+            if nb_packets == batch_size:
+                POSE_BUFFER.extend(b']')
+                CONNECTION.write(bytes(POSE_BUFFER))
+                CONNECTION.flush()
+                nb_packets = 0
+            frame += 1
+
+        if nb_packets > 0:
+            POSE_BUFFER.extend(b']')
+            CONNECTION.write(bytes(POSE_BUFFER))
+            CONNECTION.flush()
+
+        elapsed = time.time() - start_time
+        fps = nb_frames / elapsed if elapsed > 0 else 0.0
+        _print_success("sent " + str(nb_frames) + " frames in " + "%.2f" % elapsed + "s (" + "%.1f" % fps + " fps)")
+        if nb_skipped:
+            _print_error(str(nb_skipped) + " frames not sent: non-finite values (see verbose level 2)")
+    except Exception as e:
+        _print_error("cannot send timeline (" + type(e).__name__ + ": " + str(e) +")")
+
+
+################################################################################
+##########          LIVE MODE
+################################################################################
+def _toggle_live_mode(enabled):
+    if enabled:
+        _start_live_mode()
+    else:
+        _stop_live_mode()
+    # Starting may have failed (not connected)
+    _sync_live_button()
+
+
+def _sync_live_button():
+    # Signals are blocked: the button reflects LIVE_MODE, it must not toggle it back
+    if MAIN_WINDOW is None:
+        return
+    MAIN_WINDOW.live_button.blockSignals(True)
+    MAIN_WINDOW.live_button.setChecked(LIVE_MODE)
+    MAIN_WINDOW.live_button.blockSignals(False)
+
+
+def _start_live_mode():
+    '''
+    Push Maya edits to Mosketch continuously.
+    Mapped nodes are marked dirty by attribute-changed callbacks and a timer sends only the dirty ones.
+    '''
+    global LIVE_MODE
+    global LIVE_TIMER
+
+    if CONNECTION is None:
+        _print_error("Mosketch is not connected!")
+        return
+
+    if LIVE_MODE:
+        return
+
+    LIVE_MODE = True
+    _register_live_callbacks()
+    LIVE_TIMER = QtCore.QTimer(MAIN_WINDOW)
+    LIVE_TIMER.timeout.connect(_live_tick)
+    LIVE_TIMER.start(int(1000 / LIVE_RATE))
+    _print_success("live mode started (" + str(LIVE_RATE) + " Hz)")
+
+
+def _stop_live_mode():
+    global LIVE_MODE
+    global LIVE_TIMER
+
+    if not LIVE_MODE:
+        return
+
+    LIVE_MODE = False
+    if LIVE_TIMER is not None:
+        LIVE_TIMER.stop()
+        LIVE_TIMER = None
+    _remove_live_callbacks()
+    _sync_live_button()
+    _print_verbose("live mode stopped", 1)
+
+
+def _register_live_callbacks():
+    _remove_live_callbacks()
+
+    for mosketch_name, maya_node in _get_live_buffer().items():
+        _watch_live(mosketch_name, maya_node)
+    _print_verbose("live callbacks: " + str(len(LIVE_CALLBACKS)), 2)
+
+
+def _get_live_buffer():
+    if RIG["controllers"]:
+        return CONTROLLERS_BUFFER
+    return JOINTS_BUFFER
+
+
+def _watch_live(mosketch_name, maya_node):
+    try:
+        callback_id = OpenMaya.MNodeMessage.addAttributeChangedCallback(maya_node.__apimobject__(), _live_attribute_changed, mosketch_name)
+        LIVE_CALLBACKS[mosketch_name] = callback_id
+    except Exception as e:
+        _print_verbose("cannot watch " + mosketch_name + " for live mode (" + str(e) + ")", 1)
+
+
+def _unwatch_live(mosketch_name):
+    callback_id = LIVE_CALLBACKS.pop(mosketch_name, None)
+    LIVE_DIRTY.discard(mosketch_name)
+    if callback_id is not None:
+        try:
+            OpenMaya.MMessage.removeCallback(callback_id)
+        except Exception:
+            pass # Node has been deleted in the meantime
+
 
-            joint_data[JSON_KEY_NAME] = joint_name # Fill the Json key for the name
+def _remove_live_callbacks():
+    global LIVE_CALLBACKS
 
-            # W = [S] * [RO] * [R] * [JO] * [IS] * [T]
-            RO = JOINTS_ROTATE_AXIS_INV_BUFFER[joint_name].inverse()
-            JO = JOINTS_INIT_ORIENT_INV_BUFFER[joint_name].inverse()
-            quat = maya_joint.getRotation(space='transform', quaternion=True)
-            quat = RO * quat * JO
-            joint_data[JSON_KEY_ROTATION] = [quat[0], quat[1], quat[2], quat[3]]
+    for callback_id in LIVE_CALLBACKS.values():
+        try:
+            OpenMaya.MMessage.removeCallback(callback_id)
+        except Exception:
+            pass # Node has been deleted in the meantime
+    LIVE_CALLBACKS = {}
+    LIVE_DIRTY.clear()
 
-            translation = maya_joint.getTranslation(space='transform')
-            translation *= 0.01 # Mosketch uses meters. Maya uses centimeters
-            joint_data[JSON_KEY_TRANSLATION] = [translation[0], translation[1], translation[2]]
-            joints_stream[JSON_KEY_JOINTS].append(joint_data)
-        json_data = json.dumps(joints_stream)
-        CONNECTION.write(json_data)
-    except Exception, e:
-        _print_error("cannot send joint value (" + str(e) + ")")
 
+def _live_attribute_changed(msg, plug, other_plug, mosketch_name):
+    # Values we apply from Mosketch must not be sent back
+    if LIVE_APPLYING or not (msg & OpenMaya.MNodeMessage.kAttributeSet):
+        return
 
-################################################################################
-##########          SEND CONTROLLERS
-################################################################################
-def _update_mosketch_from_controllers():
-    '''
-    We send "full" local rotations and local translations.
-    So we need to add rotate axis and joint orient.
-    '''
-    # For every joint, pack data, then send packet
-    try:
-        quat = pmc.datatypes.Quaternion()
-        joints_buffer_values = CONTROLLERS_BUFFER.values()
-        joints_stream = {}
-        joints_stream[JSON_KEY_TYPE] = "JointsStream"
-        joints_stream[JSON_KEY_JOINTS] = []
-        for maya_joint in joints_buffer_values:
-            joint_data = {} # Reinit it
-            idx_name = maya_joint.name()
-
-            if ((MODEL_NAME == "Mosko_Rigged") or (MODEL_NAME == "DeepSea_Rigged")):
-              if idx_name.startswith(PREFIX_FKX):
-                  idx_name = idx_name.replace(PREFIX_FKX, "", 1)
-              elif idx_name.startswith(PREFIX_FK):
-                  idx_name = idx_name.replace(PREFIX_FK, "", 1)
-              elif idx_name == "RootX_M":
-                  joint_data[JSON_KEY_NAME] = idx_name # Fill the Json key for the name
-                  # For this controller we need to take an offset into account
-                  if (MODEL_NAME == "Mosko_Rigged"):
-                      offset = ROOTS_SYSTEM["RootCenter_M"]
-                  elif (MODEL_NAME == "DeepSea_Rigged"):
-                      offset = ROOTS_SYSTEM["RootOffsetX_M"]
-                  oT = offset.getTranslation(space='transform')
-                  # The root controller has a pre transform
-                  offset = ROOTS_SYSTEM["FKOffsetRoot_M"]
-                  oJO = offset.getRotation(space='transform', quaternion=True)
-                  RO = CONTROLLERS_ROTATE_AXIS_INV_BUFFER[idx_name].inverse()
-                  JO = CONTROLLERS_INIT_ORIENT_INV_BUFFER[idx_name].inverse()
-                  quat = maya_joint.getRotation(space='transform', quaternion=True)
-                  quat = oJO * RO * quat * JO * oJO.inverse()
-                  joint_data[JSON_KEY_ROTATION] = [quat[0], quat[1], quat[2], quat[3]]
-
-                  translation = maya_joint.getTranslation(space='transform')
-                  translation += oT
-                  translation *= 0.01 # Mosketch uses meters. Maya uses centimeters
-                  joint_data[JSON_KEY_TRANSLATION] = [translation[0], translation[1], translation[2]]
-                  joints_stream[JSON_KEY_JOINTS].append(joint_data)
-                  continue
-
-            joint_data[JSON_KEY_NAME] = idx_name # Fill the Json key for the name
-
-            # W = [S] * [RO] * [R] * [JO] * [IS] * [T]
-            RO = CONTROLLERS_ROTATE_AXIS_INV_BUFFER[idx_name].inverse()
-            JO = CONTROLLERS_INIT_ORIENT_INV_BUFFER[idx_name].inverse()
-            quat = maya_joint.getRotation(space='transform', quaternion=True)
-            quat = RO * quat * JO
-           
-            #extra = _compute_extra(idx_name)
-            #quat = extra*quat
+    attribute_name = plug.partialName(False, False, False, False, False, True)
+    if attribute_name in LIVE_ATTRIBUTES:
+        LIVE_DIRTY.add(mosketch_name)
 
-            joint_data[JSON_KEY_ROTATION] = [quat[0], quat[1], quat[2], quat[3]]
 
-            translation = maya_joint.getTranslation(space='transform')
-            translation *= 0.01 # Mosketch uses meters. Maya uses centimeters
-            joint_data[JSON_KEY_TRANSLATION] = [translation[0], translation[1], translation[2]]
-            joints_stream[JSON_KEY_JOINTS].append(joint_data)
-        json_data = json.dumps(joints_stream)
-        CONNECTION.write(json_data)
-    except Exception, e:
-        _print_error("cannot send joint value (" + str(e) + ")")
+def _live_tick():
+    if not LIVE_DIRTY:
+        return
+
+    if CONNECTION is None:
+        _stop_live_mode()
+        return
+
+    dirty_joints = list(LIVE_DIRTY)
+    LIVE_DIRTY.clear()
+    _send_pose(dirty_joints)
 
 
 ################################################################################
@@ -528,12 +1865,107 @@ def _send_ack_hierarchy_initialized():
         _print_error("cannot send AckHierarchyInitialized (" + str(e) + ")")
 
 
+################################################################################
+##########          Latency
+################################################################################
+def export_latency(file_path):
+    """
+    Call this function after a session to save the latency percentiles and histograms:
+        mosketch_for_maya.export_latency("C:/sessions/latency.json")
+    """
+    latency = {"bucket_ms": LATENCY_BUCKET_MS, "window": LATENCY_WINDOW}
+    for kind in ("apply", "round_trip"):
+        histogram = LATENCY_HISTOGRAMS[kind]
+        latency[kind] = {
+            "rolling": _get_latency_percentiles(kind),
+            "session": _get_histogram_percentiles(histogram),
+            "histogram": [[index * LATENCY_BUCKET_MS, count] for index, count in enumerate(histogram) if count],
+        }
+    with open(file_path, "w") as latency_stream:
+        json.dump(latency, latency_stream, indent=1, sort_keys=True)
+    _print_success("latency written to " + file_path)
+
+
+def _next_stream_sequence():
+    '''
+    Return (Seq, SentAt) for the next JointsStream sent, and remember when it left.
+    '''
+    global STREAM_SEQUENCE
+
+    STREAM_SEQUENCE += 1
+    sent_at = mosketch_session_log.clock()
+    STREAM_SENT_TIMES[STREAM_SEQUENCE] = sent_at
+    if len(STREAM_SENT_TIMES) > LATENCY_WINDOW:
+        STREAM_SENT_TIMES.popitem(last=False) # Never acked
+    return STREAM_SEQUENCE, sent_at
+
+
+def _process_joints_stream_ack(ack_data):
+    sent_at = STREAM_SENT_TIMES.pop(ack_data.get(JSON_KEY_SEQUENCE), None)
+    if sent_at is not None:
+        _add_latency("round_trip", mosketch_session_log.clock() - sent_at)
+
+
+def _add_latency(kind, seconds):
+    milliseconds = seconds * 1000.0
+    LATENCY_SAMPLES[kind].append(milliseconds)
+    LATENCY_HISTOGRAMS[kind][min(int(milliseconds / LATENCY_BUCKET_MS), LATENCY_BUCKETS - 1)] += 1
+
+
+def _reset_latency():
+    global STREAM_RECEIVED_AT
+
+    for kind in LATENCY_SAMPLES:
+        LATENCY_SAMPLES[kind].clear()
+        LATENCY_HISTOGRAMS[kind] = array.array('L', [0]) * LATENCY_BUCKETS
+    STREAM_SENT_TIMES.clear()
+    STREAM_RECEIVED_AT = None
+
+
+def _get_latency_percentiles(kind):
+    # Rolling percentiles in ms of the last LATENCY_WINDOW samples, None without samples
+    samples = sorted(LATENCY_SAMPLES[kind])
+    if not samples:
+        return None
+    return dict([(label, _get_percentile(samples, fraction)) for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))])
+
+
+def _get_histogram_percentiles(histogram):
+    # Whole session percentiles in ms (upper bound of the bucket), None without samples
+    total = sum(histogram)
+    if not total:
+        return None
+    percentiles = {}
+    for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        rank = fraction * total
+        count = 0
+        for index, bucket_count in enumerate(histogram):
+            count += bucket_count
+            if count >= rank:
+                percentiles[label] = (index + 1) * LATENCY_BUCKET_MS
+                break
+    return percentiles
+
+
+def _get_latency_text():
+    texts = []
+    for kind, label in (("apply", "Apply"), ("round_trip", "Round trip")):
+        percentiles = _get_latency_percentiles(kind)
+        if percentiles is None:
+            texts.append(label + " -")
+        else:
+            texts.append(label + " p50 " + "%.1f" % percentiles["p50"] + " / p95 " + "%.1f" % percentiles["p95"]
+                         + " / p99 " + "%.1f" % percentiles["p99"] + " ms")
+    return "  |  ".join(texts)
+
+
 ################################################################################
 ##########          Ack joints stream
 ################################################################################
-def _send_ack_jointstream_received():
+def _send_ack_jointstream_received(joints_stream_data=None):
     '''
     We send an acknowlegment to let Mosketch know that we received JointsStream.
+    Seq and SentAt of the JointsStream are echoed back, with the time it took to apply it (ApplyMs).
     '''
     # Useless to prepare the data if we have no connection
     if CONNECTION is None:
@@ -542,6 +1974,14 @@ def _send_ack_jointstream_received():
     try:
         ack_packet = {}
         ack_packet[JSON_KEY_TYPE] = "JointsStreamAck"
+        if STREAM_RECEIVED_AT is not None:
+            apply_time = mosketch_session_log.clock() - STREAM_RECEIVED_AT
+            _add_latency("apply", apply_time)
+            ack_packet[JSON_KEY_APPLY_MS] = round(apply_time * 1000.0, 3)
+        if joints_stream_data is not None:
+            for key in (JSON_KEY_SEQUENCE, JSON_KEY_SENT_AT):
+                if key in joints_stream_data:
+                    ack_packet[key] = joints_stream_data[key]
         json_data = json.dumps(ack_packet)
         CONNECTION.write(json_data)
         #_print_verbose("JointsStreamAck sent", 1)
@@ -559,6 +1999,7 @@ def _got_data():
         - Type == "Hierarchy" => Initialize skeleton
         - Type == "JointsStream" => Copy paste received values on Maya's joints
         - Type == "JointsUuids" => Receiving Mosketch UUIDs for all joints
+        - Type == "JointsStreamAck" => Mosketch applied one of our JointsStreams
         - Type == "NetCommand" => Packet type to send Mosketch commands
     """
     try:
@@ -582,6 +2023,12 @@ def _process_data(arg):
     """
     We received a Json object. It may be a JointsStream or a Hierarchy
     """
+    global STREAM_RECEIVED_AT
+
+    STREAM_RECEIVED_AT = mosketch_session_log.clock()
+    if RECORDER is not None:
+        RECORDER.record(arg)
+
     size = str(sys.getsizeof(arg))
     _print_verbose("Paquet size:" + size, 2)
     _print_verbose(arg, 2)
@@ -593,8 +2040,12 @@ def _process_data(arg):
             _process_hierarchy(data)
         elif data[JSON_KEY_TYPE] == "JointsStream":
             _process_joints_stream(data)
+            if CAPTURE_TIMES is not None:
+                _capture_pose()
         elif data[JSON_KEY_TYPE] == "JointsUuids":
             _process_joints_uuids(data)
+        elif data[JSON_KEY_TYPE] == "JointsStreamAck":
+            _process_joints_stream_ack(data)
         else:
             _print_error("Unknown data type received: " + data[JSON_KEY_TYPE])
     except ValueError:
@@ -602,155 +2053,741 @@ def _process_data(arg):
         return
     except Exception as e:
         _print_error("cannot process data (" + type(e).__name__ + ": " + str(e) +")")
+    finally:
+        # Only the JointsStream being applied is timed (see _send_ack_jointstream_received)
+        STREAM_RECEIVED_AT = None
 
 
 ################################################################################
 ##########          Hierarchy init
 ################################################################################
 def _process_hierarchy(hierarchy_data):
-    global JOINTS_BUFFER
-    global JOINTS_INIT_ORIENT_INV_BUFFER
-    global JOINTS_ROTATE_AXIS_INV_BUFFER
-    global CONTROLLERS_BUFFER
-    global CONTROLLERS_INIT_ORIENT_INV_BUFFER
-    global CONTROLLERS_ROTATE_AXIS_INV_BUFFER
+    global SCENE_JOINTS
+    global SCENE_TRANSFORMS
+    global HIERARCHY_JOINTS
 
     try:
-        # First empty JOINTS_BUFFER
-        JOINTS_BUFFER = {}
-        JOINTS_INIT_ORIENT_INV_BUFFER = {}
-        JOINTS_ROTATE_AXIS_INV_BUFFER = {}
-        CONTROLLERS_BUFFER = {}
-        CONTROLLERS_INIT_ORIENT_INV_BUFFER = {}
-        CONTROLLERS_ROTATE_AXIS_INV_BUFFER = {}
-
-        # Retrieve all joints from Maya and Transforms (we may be streaming to controllers too)
-        all_maya_joints = pmc.ls(type="joint")
-        all_maya_transform = pmc.ls(type="transform")
-
-        # Then from all joints in the hierarchy, lookup in maya joints
-        joints_name = hierarchy_data["Joints"]
-
-        for joint_name in joints_name:
-            # In Advanced Skeleton Joint's controllers are prefixed with 'FK'
-            prefixed_name = PREFIX_FK + joint_name
-            # except for RooX_M which we want as is
-            if joint_name == "RootX_M":
-                prefixed_name = joint_name
-            # We are also missing controllers for end toes in Mosko, so we plug joint onto joint
-            if (MODEL_NAME == "Mosko_Rigged"):
-                if (joint_name == 'ToesEnd_L'):
-                    prefixed_name = 'ToesEnd_L'
-                if (joint_name == 'ToesEnd_R'):
-                    prefixed_name = 'ToesEnd_R'
-            if (MODEL_NAME == "DeepSea_Rigged"):
-                prefixed_name = _deepsea_controllers(joint_name)
-
-            # We store joints in any cases
-            maya_real_joints = [maya_joint for maya_joint in all_maya_joints if maya_joint.name() == joint_name]
-            if maya_real_joints:
-                # We should have one Maya joint mapped anyways
-                if len(maya_real_joints) != 1:
-                    _print_error("We should have 1 Maya joint mapped only. Taking the first one only.")                
-                _map_joint(joint_name, maya_real_joints[0])
-
-            # Then we store controllers, there might be somle joints too for simplicity
-            maya_joints = [maya_joint for maya_joint in all_maya_transform if maya_joint.name() == prefixed_name]
-            if maya_joints:
-                # We should have one Maya joint mapped anyways
-                if len(maya_joints) != 1:
-                    _print_error("We should have 1 Maya joint mapped only. Taking the first one only.")
-                _map_controller(joint_name, maya_joints[0])
+        timings = []
+        cache = None
+
+        # A new Hierarchy on a mapped connection (variant skeleton...): only resolve what changed
+        if JOINTS_BUFFER and MAPPING_NAMESPACE is not None:
+            mapped = _remap_hierarchy(hierarchy_data["Joints"], timings)
+        else:
+            # Then from all joints in the hierarchy, lookup in maya joints
+            HIERARCHY_JOINTS = hierarchy_data["Joints"]
+            _check_rig_hierarchy()
+            SCENE_JOINTS = {}
+            SCENE_TRANSFORMS = {}
+
+            # Same scene and same hierarchy as a previous connection: no need to look at the scene
+            start_time = time.time()
+            cache = _load_mapping_cache()
+            timings.append(("cache", time.time() - start_time))
+
+            if cache is None:
+                _query_hierarchy(timings)
+            mapped = _map_hierarchy(timings, cache)
 
         # If no mapping close connection
-        if (len(JOINTS_BUFFER) == 0):
+        if not mapped:
             _close_connection()
             _print_error("Couldn't map joints. Check Maya's namespaces maybe.")
             return
 
-        _send_ack_hierarchy_initialized()
+        if cache is None:
+            _save_mapping_cache()
 
-        # Print nb joints in Maya and nb joints in BUFFER for information purposes
-        _print_success("mapped " + str(len(JOINTS_BUFFER)) + " maya joints out of " + str(len(all_maya_transform)))
-        _print_success("Buffers size: " + str(len(JOINTS_BUFFER)) + " / " + str(len(JOINTS_ROTATE_AXIS_INV_BUFFER)) + " / " + str(len(JOINTS_INIT_ORIENT_INV_BUFFER)))
-        _print_verbose('Joints buffer = ' + str(len(JOINTS_BUFFER)) + ', controllers buffer = ' + str(len(CONTROLLERS_BUFFER)), 1)
+        _index_hierarchy_slots()
+        _send_ack_hierarchy_initialized()
 
     except Exception as e:
         _print_error("cannot process hierarchy data (" + type(e).__name__ + ": " + str(e) +")")
-    #_send_static_inter_joints() # Example to send multiple joints as non sketchable
+    #_send_inter_joints() # Send joints found with no controller as non sketchable
+    if RIG["send_static_inter_joints"] and CONNECTION is not None:
+        _send_static_inter_joints() # Send multiple joints as non sketchable
 
     # Send orientation mode
-    if (MODEL_NAME == "Mosko_noRig"):
-        _send_command_orientMode(1)
-    elif (MODEL_NAME == "Mosko_Rigged"):
-        _send_command_orientMode(0)
+    if RIG["orient_mode"] is not None:
+        _send_command_orientMode(RIG["orient_mode"])
 
     # Sepcify in which space we want to work. Default is Local
     _send_command_jointSpace("Local")
     #_send_command_jointSpace("World")
 
+
+################################################################################
+##########          Look up the names of HIERARCHY_JOINTS in all namespaces
+##########          Only query the names we need: cost scales with the rig, not with the scene
+################################################################################
+def _query_hierarchy(timings=None):
+    # We store joints in any cases. Then we store controllers, there might be some joints too for simplicity
+    controllers_name = [_get_controller_name(joint_name) for joint_name in HIERARCHY_JOINTS]
+    _query_scene_names(HIERARCHY_JOINTS, controllers_name + _get_root_system_names(), timings)
+
+
+################################################################################
+##########          Bind HIERARCHY_JOINTS to the Maya nodes of one namespace
+##########          Only reads SCENE_JOINTS and SCENE_TRANSFORMS (or the mapping cache), the scene is not queried
+################################################################################
+def _map_hierarchy(timings, cache=None):
+    global JOINTS_BUFFER
+    global JOINTS_INIT_ORIENT_INV_BUFFER
+    global JOINTS_ROTATE_AXIS_INV_BUFFER
+    global JOINTS_INIT_ORIENT_BUFFER
+    global JOINTS_ROTATE_AXIS_BUFFER
+    global CONTROLLERS_BUFFER
+    global CONTROLLERS_INIT_ORIENT_INV_BUFFER
+    global CONTROLLERS_ROTATE_AXIS_INV_BUFFER
+    global CONTROLLERS_INIT_ORIENT_BUFFER
+    global CONTROLLERS_ROTATE_AXIS_BUFFER
+    global MAPPING_NAMESPACE
+
+    # First empty JOINTS_BUFFER
+    _remove_rest_callbacks()
+    _remove_maya_uuid_callbacks()
+    _reset_pose_plan()
+    JOINTS_BUFFER = {}
+    JOINTS_INIT_ORIENT_INV_BUFFER = {}
+    JOINTS_ROTATE_AXIS_INV_BUFFER = {}
+    JOINTS_INIT_ORIENT_BUFFER = {}
+    JOINTS_ROTATE_AXIS_BUFFER = {}
+    CONTROLLERS_BUFFER = {}
+    CONTROLLERS_INIT_ORIENT_INV_BUFFER = {}
+    CONTROLLERS_ROTATE_AXIS_INV_BUFFER = {}
+    CONTROLLERS_INIT_ORIENT_BUFFER = {}
+    CONTROLLERS_ROTATE_AXIS_BUFFER = {}
+    ROOTS_SYSTEM.clear()
+
+    start_time = time.time()
+    if cache is None:
+        MAPPING_NAMESPACE = _choose_namespace()
+        mapping = _resolve_joints(HIERARCHY_JOINTS)
+    else:
+        MAPPING_NAMESPACE = cache["namespace"]
+        mapping = _get_cached_mapping(cache)
+    timings.append(("resolve", time.time() - start_time))
+
+    start_time = time.time()
+    _map_joints(mapping)
+    timings.append(("map", time.time() - start_time))
+
+    start_time = time.time()
+    INTER_JOINTS_BUFFER.clear()
+    _update_inter_joints(HIERARCHY_JOINTS)
+    timings.append(("inter joints", time.time() - start_time))
+
     # Look for our root offset
-    _fill_root_system()
+    if cache is None:
+        _fill_root_system()
+    else:
+        for root_name, maya_path in cache["roots"].items():
+            ROOTS_SYSTEM[root_name] = pmc.PyNode(maya_path)
+    _print_timings("Hierarchy mapping", timings)
+
+    if (len(JOINTS_BUFFER) == 0):
+        return False
+
+    # Live callbacks are bound to the previous mapping
+    if LIVE_MODE:
+        _register_live_callbacks()
+
+    # Print nb joints in Maya and nb joints in BUFFER for information purposes
+    _print_success("mapped " + str(len(JOINTS_BUFFER)) + " maya joints out of " + str(len(HIERARCHY_JOINTS)) + " in namespace '" + MAPPING_NAMESPACE + "'")
+    _print_success("Buffers size: " + str(len(JOINTS_BUFFER)) + " / " + str(len(JOINTS_ROTATE_AXIS_INV_BUFFER)) + " / " + str(len(JOINTS_INIT_ORIENT_INV_BUFFER)))
+    _print_verbose('Joints buffer = ' + str(len(JOINTS_BUFFER)) + ', controllers buffer = ' + str(len(CONTROLLERS_BUFFER)), 1)
+    return True
+
+
+def _resolve_joints(joints_name):
+    '''
+    Resolve joints_name in MAPPING_NAMESPACE from the scene lookups. Ambiguity is reported before anything is bound.
+    '''
+    duplicates = {}
+    mapping = []
+    for joint_name in joints_name:
+        maya_joint = _lookup_name_index(SCENE_JOINTS, joint_name, MAPPING_NAMESPACE, duplicates)
+        maya_controller = _lookup_name_index(SCENE_TRANSFORMS, _get_controller_name(joint_name), MAPPING_NAMESPACE, duplicates)
+        mapping.append((joint_name, maya_joint, None, maya_controller, None))
+
+    if duplicates:
+        _print_error(str(len(duplicates)) + " name(s) match several Maya nodes in namespace '" + MAPPING_NAMESPACE + "'. Taking the first one only.")
+        for name in sorted(duplicates):
+            _print_verbose("duplicate " + name + ": " + ", ".join(duplicates[name]), 1)
+    return mapping
+
+
+def _map_joints(mapping):
+    # mapping is a list of (name, maya joint, joint rest, maya controller, controller rest), rest None to read it from Maya
+    for joint_name, maya_joint, joint_rest, maya_controller, controller_rest in mapping:
+        if maya_joint is not None:
+            _map_joint(joint_name, maya_joint, joint_rest)
+        if maya_controller is not None:
+            _map_controller(joint_name, maya_controller, controller_rest)
+
+
+################################################################################
+##########          Diff a new hierarchy against the current mapping
+##########          Unchanged joints are kept as is, time is proportional to the change
+################################################################################
+def _remap_hierarchy(joints_name, timings):
+    global HIERARCHY_JOINTS
+
+    start_time = time.time()
+    previous_joints = set(HIERARCHY_JOINTS)
+    new_joints = set(joints_name)
+    removed_joints = [joint_name for joint_name in HIERARCHY_JOINTS if joint_name not in new_joints]
+    added_joints = [joint_name for joint_name in joints_name if joint_name not in previous_joints]
+    HIERARCHY_JOINTS = joints_name
+    _check_rig_hierarchy()
+    timings.append(("diff", time.time() - start_time))
+
+    start_time = time.time()
+    for joint_name in removed_joints:
+        _unmap_joint(joint_name)
+    timings.append(("unmap", time.time() - start_time))
+
+    if added_joints:
+        # The scene may have changed since these names were looked up
+        controllers_name = [_get_controller_name(joint_name) for joint_name in added_joints]
+        for name in added_joints:
+            SCENE_JOINTS.pop(name, None)
+        for name in controllers_name:
+            SCENE_TRANSFORMS.pop(name, None)
+        _query_scene_names(added_joints, controllers_name, timings)
+
+        start_time = time.time()
+        mapping = _resolve_joints(added_joints)
+        timings.append(("resolve", time.time() - start_time))
+
+        start_time = time.time()
+        _map_joints(mapping)
+        _update_inter_joints(added_joints)
+        if LIVE_MODE:
+            live_buffer = _get_live_buffer()
+            for joint_name in added_joints:
+                if joint_name in live_buffer:
+                    _watch_live(joint_name, live_buffer[joint_name])
+        timings.append(("map", time.time() - start_time))
+
+    if removed_joints or added_joints:
+        _reset_pose_plan()
+    _print_timings("Hierarchy remapping", timings)
+
+    if (len(JOINTS_BUFFER) == 0):
+        return False
+
+    _print_success("remapped " + str(len(added_joints)) + " added and " + str(len(removed_joints)) + " removed joints, kept " + str(len(joints_name) - len(added_joints)))
+    return True
+
+
+def _unmap_joint(mosketch_name):
+    for buffer in (JOINTS_BUFFER, JOINTS_INIT_ORIENT_INV_BUFFER, JOINTS_ROTATE_AXIS_INV_BUFFER, JOINTS_INIT_ORIENT_BUFFER, JOINTS_ROTATE_AXIS_BUFFER,
+                   CONTROLLERS_BUFFER, CONTROLLERS_INIT_ORIENT_INV_BUFFER, CONTROLLERS_ROTATE_AXIS_INV_BUFFER, CONTROLLERS_INIT_ORIENT_BUFFER, CONTROLLERS_ROTATE_AXIS_BUFFER):
+        buffer.pop(mosketch_name, None)
+    _unwatch_rest_transform(mosketch_name, False)
+    _unwatch_rest_transform(mosketch_name, True)
+    _unwatch_maya_uuid(mosketch_name, False)
+    _unwatch_maya_uuid(mosketch_name, True)
+    _unwatch_live(mosketch_name)
+    INTER_JOINTS_BUFFER.pop(mosketch_name, None)
+
+
+def _update_inter_joints(joints_name):
+    # Inter joints are found in Maya but have no controller mapped: set lookups only, no scene query
+    if not RIG["controllers"]:
+        return
+    for joint_name in joints_name:
+        if joint_name in JOINTS_BUFFER and joint_name not in CONTROLLERS_BUFFER:
+            INTER_JOINTS_BUFFER[joint_name] = JOINTS_BUFFER[joint_name]
+        else:
+            INTER_JOINTS_BUFFER.pop(joint_name, None)
+
+
+def _choose_namespace():
+    '''
+    Return NAMESPACE if set. Otherwise the namespace holding most of the hierarchy joints, reporting the other candidates.
+    '''
+    counts = {}
+    for joint_name in HIERARCHY_JOINTS:
+        for namespace in SCENE_JOINTS.get(joint_name, {}):
+            counts[namespace] = counts.get(namespace, 0) + 1
+
+    if NAMESPACE is not None:
+        if NAMESPACE not in counts:
+            _print_error("no joint of the hierarchy in namespace '" + NAMESPACE + "'")
+        return NAMESPACE
+    if not counts:
+        return ""
+
+    namespaces = sorted(counts, key=lambda namespace: (-counts[namespace], namespace))
+    if len(namespaces) > 1:
+        candidates = ", ".join(["'" + namespace + "' (" + str(counts[namespace]) + " joints)" for namespace in namespaces])
+        _print_error("hierarchy found in several namespaces: " + candidates + ". Binding to '" + namespaces[0] + "', use set_namespace() to choose.")
+    return namespaces[0]
+
+
+################################################################################
+##########          Scene name index used to resolve Mosketch names to Maya nodes
+################################################################################
+def _query_scene_names(joints_name, transforms_name, timings=None):
+    '''
+    One exact-name ls (with node types) of every name still unknown, in all namespaces.
+    Each node is classified once: joints into SCENE_JOINTS, all transforms into SCENE_TRANSFORMS ({short name: {namespace: [long paths]}}).
+    Names already looked up are not queried again, so nothing is listed once everything is known.
+    '''
+    start_time = time.time()
+    missing_joints = set([name for name in joints_name if name not in SCENE_JOINTS])
+    missing_transforms = set([name for name in transforms_name if name not in SCENE_TRANSFORMS])
+    missing = list(missing_joints | missing_transforms)
+    found = []
+    for start in range(0, len(missing), SCENE_QUERY_CHUNK):
+        found.extend(cmds.ls(missing[start:start + SCENE_QUERY_CHUNK], type="transform", long=True, recursive=True, showType=True) or [])
+    scan_time = time.time() - start_time
+
+    start_time = time.time()
+    joints_any_transform = RIG["joints_any_transform"]
+    for name in missing_joints:
+        SCENE_JOINTS[name] = {}
+    for name in missing_transforms:
+        SCENE_TRANSFORMS[name] = {}
+    # showType gives [path, type, path, type...]
+    for index in range(0, len(found), 2):
+        maya_path = found[index]
+        namespace, _, name = maya_path.rpartition('|')[2].rpartition(':')
+        if name in missing_transforms:
+            SCENE_TRANSFORMS[name].setdefault(namespace, []).append(maya_path)
+        if name in missing_joints and (joints_any_transform or found[index + 1] == "joint"):
+            SCENE_JOINTS[name].setdefault(namespace, []).append(maya_path)
+    classify_time = time.time() - start_time
+
+    if timings is not None:
+        timings.append(("scan scene", scan_time))
+        timings.append(("classify", classify_time))
+
+
+def _lookup_name_index(index, name, namespace, duplicates):
+    '''
+    Return the PyNode named name in namespace, or None. Ambiguous names are recorded in duplicates and resolved to the first node.
+    '''
+    maya_paths = index.get(name, {}).get(namespace)
+    if not maya_paths:
+        return None
+    if len(maya_paths) != 1:
+        duplicates[name] = maya_paths
+    return pmc.PyNode(maya_paths[0])
 
 
 ################################################################################
 ##########          This is filling arrays to map Mosketch name to a Maya joint or transform
 ################################################################################
-def _map_joint(mosketch_name, maya_joint):
+def _map_joint(mosketch_name, maya_joint, rest=None):
     JOINTS_BUFFER[mosketch_name] = maya_joint
-    vRO = maya_joint.getRotateAxis()
-    RO = pmc.datatypes.EulerRotation(vRO[0], vRO[1], vRO[2]).asQuaternion()
+    if rest is not None:
+        # Rotate axis and joint orient from the mapping cache
+        RO, JO = rest
+        JOINTS_ROTATE_AXIS_BUFFER[mosketch_name] = RO
+        JOINTS_ROTATE_AXIS_INV_BUFFER[mosketch_name] = RO.inverse()
+        JOINTS_INIT_ORIENT_BUFFER[mosketch_name] = JO
+        JOINTS_INIT_ORIENT_INV_BUFFER[mosketch_name] = JO.inverse()
+        _watch_rest_transform(mosketch_name, maya_joint, False)
+        _watch_maya_uuid(mosketch_name, maya_joint, False)
+        return
+    RO = _get_rest_rotate_axis(maya_joint)
+    JOINTS_ROTATE_AXIS_BUFFER[mosketch_name] = RO
     JOINTS_ROTATE_AXIS_INV_BUFFER[mosketch_name] = RO.inverse()
     try:
         # We have a Joint => Get joint_orient into account
         JO = maya_joint.getOrientation().inverse()
         JOINTS_INIT_ORIENT_INV_BUFFER[mosketch_name] = JO
+        JOINTS_INIT_ORIENT_BUFFER[mosketch_name] = JO.inverse()
         _print_verbose("j: " + mosketch_name + " - " + maya_joint.name() + " " + str(RO[0]) + " " + str(RO[1]) + " " + str(RO[2]) + " " + str(RO[3]) + "; " + str(JO[0]) + " " + str(JO[1]) + " " + str(JO[2]) + " " + str(JO[3]), 2)
     except Exception:
         # We have a Transform => Do NOT get joint_orient into account but the initial transform instead
         JO = maya_joint.getRotation(space='transform', quaternion=True).inverse()
         JOINTS_INIT_ORIENT_INV_BUFFER[mosketch_name] = JO
+        JOINTS_INIT_ORIENT_BUFFER[mosketch_name] = JO.inverse()
         #_print_verbose("t: " + mosketch_name + " - " + maya_joint.name() + " " + str(RO[0]) + " " + str(RO[1]) + " " + str(RO[2]) + " " + str(RO[3]) + "; " + str(JO[0]) + " " + str(JO[1]) + " " + str(JO[2]) + " " + str(JO[3]), 2)
         _print_verbose("WARNING: we have a controller while we should have a joint: " + mosketch_name + " - " + maya_joint.name(), 1)
+    _watch_rest_transform(mosketch_name, maya_joint, False)
+    _watch_maya_uuid(mosketch_name, maya_joint, False)
 
 
 ################################################################################
 ##########          This is filling arrays to map Mosketch name to a Maya controller
 ################################################################################
-def _map_controller(mosketch_name, maya_controller):
+def _map_controller(mosketch_name, maya_controller, rest=None):
     CONTROLLERS_BUFFER[mosketch_name] = maya_controller
-    vRO = maya_controller.getRotateAxis()
-    RO = pmc.datatypes.EulerRotation(vRO[0], vRO[1], vRO[2]).asQuaternion()
+    if rest is not None:
+        # Rotate axis and initial rotation from the mapping cache
+        RO, JO = rest
+        CONTROLLERS_ROTATE_AXIS_BUFFER[mosketch_name] = RO
+        CONTROLLERS_ROTATE_AXIS_INV_BUFFER[mosketch_name] = RO.inverse()
+        CONTROLLERS_INIT_ORIENT_BUFFER[mosketch_name] = JO
+        CONTROLLERS_INIT_ORIENT_INV_BUFFER[mosketch_name] = JO.inverse()
+        _watch_rest_transform(mosketch_name, maya_controller, True)
+        _watch_maya_uuid(mosketch_name, maya_controller, True)
+        return
+    RO = _get_rest_rotate_axis(maya_controller)
+    CONTROLLERS_ROTATE_AXIS_BUFFER[mosketch_name] = RO
     CONTROLLERS_ROTATE_AXIS_INV_BUFFER[mosketch_name] = RO.inverse()
     try:
         # We have a Joint => Get joint_orient into account
         JO = maya_controller.getOrientation().inverse()
         CONTROLLERS_INIT_ORIENT_INV_BUFFER[mosketch_name] = JO
+        CONTROLLERS_INIT_ORIENT_BUFFER[mosketch_name] = JO.inverse()
         _print_verbose("WARNING: we have a joint while we should have a controller: " + mosketch_name + " - " + maya_controller.name(), 2)
     except Exception:
         # We have a Transform => Do NOT get joint_orient into account but the initial transform instead
         JO = maya_controller.getRotation(space='transform', quaternion=True).inverse()
         CONTROLLERS_INIT_ORIENT_INV_BUFFER[mosketch_name] = JO
+        CONTROLLERS_INIT_ORIENT_BUFFER[mosketch_name] = JO.inverse()
         _print_verbose("t: " + mosketch_name + " - " + maya_controller.name() + " " + str(RO[0]) + " " + str(RO[1]) + " " + str(RO[2]) + " " + str(RO[3]) + "; " + str(JO[0]) + " " + str(JO[1]) + " " + str(JO[2]) + " " + str(JO[3]), 2)
+    _watch_rest_transform(mosketch_name, maya_controller, True)
+    _watch_maya_uuid(mosketch_name, maya_controller, True)
+
+
+################################################################################
+##########          MAPPING CACHE
+##########          Reconnecting to the same saved scene with the same hierarchy loads the mapping from disk
+################################################################################
+def _get_mapping_cache_file():
+    '''
+    Return the cache file of the current scene, model, namespace and hierarchy, or None when the scene cannot be cached.
+    '''
+    if not MAPPING_CACHE:
+        return None
+    # Streamed poses modify the scene: unsaved rig edits are caught by the rest attributes check of _load_mapping_cache instead
+    scene_path = cmds.file(query=True, sceneName=True)
+    if not scene_path:
+        return None
+
+    cache_dir = MAPPING_CACHE_DIR
+    if cache_dir is None:
+        cache_dir = os.path.join(cmds.internalVar(userAppDir=True), "mosketch_cache")
+    # The profile is part of the key: edited naming rules map the hierarchy again
+    key = json.dumps([scene_path, MODEL_NAME, RIG_PROFILES[MODEL_NAME], NAMESPACE, _get_hierarchy_hash()], sort_keys=True)
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+
+def _get_hierarchy_hash():
+    return hashlib.sha1("\n".join(HIERARCHY_JOINTS).encode("utf-8")).hexdigest()
+
+
+def _load_mapping_cache():
+    '''
+    Return the cached mapping if it still matches the scene, None otherwise (a rescan is needed).
+    '''
+    try:
+        cache_file = _get_mapping_cache_file()
+        if cache_file is None or not os.path.isfile(cache_file):
+            return None
+        with open(cache_file, "r") as cache_stream:
+            cache = json.load(cache_stream)
+
+        # Cheap validation: same scene and referenced files and hierarchy, every cached node still exists with the same rest attributes
+        scene_path = cmds.file(query=True, sceneName=True)
+        if (cache.get("version") != MAPPING_CACHE_VERSION or cache["scene"] != scene_path
+                or cache["files"] != _get_scene_files() or cache["hierarchy"] != _get_hierarchy_hash()):
+            _print_verbose("mapping cache is out of date", 1)
+            return None
+        mapped_paths = set([maya_path for entry in cache["mapping"] for maya_path in (entry[1], entry[3]) if maya_path])
+        maya_paths = mapped_paths.union(cache["roots"].values())
+        if len(set(cmds.ls(list(maya_paths), long=True) or [])) != len(maya_paths):
+            _print_verbose("mapping cache refers to missing nodes", 1)
+            return None
+        rest_attributes = _get_rest_attributes(mapped_paths)
+        for maya_path, values in cache["rest_attributes"].items():
+            if len(values) != len(rest_attributes[maya_path]) or max([abs(a - b) for a, b in zip(values, rest_attributes[maya_path])]) > 1e-9:
+                _print_verbose("mapping cache has other rest transforms for " + maya_path, 1)
+                return None
+
+        _print_verbose("mapping loaded from " + cache_file, 1)
+        return cache
+    except Exception as e:
+        _print_verbose("cannot load mapping cache (" + type(e).__name__ + ": " + str(e) + ")", 1)
+        return None
+
+
+def _save_mapping_cache():
+    try:
+        cache_file = _get_mapping_cache_file()
+        if cache_file is None:
+            return
+
+        mapping = []
+        for joint_name in HIERARCHY_JOINTS:
+            entry = [joint_name, None, None, None, None]
+            if joint_name in JOINTS_BUFFER:
+                entry[1] = JOINTS_BUFFER[joint_name].longName()
+                entry[2] = list(JOINTS_ROTATE_AXIS_BUFFER[joint_name]) + list(JOINTS_INIT_ORIENT_BUFFER[joint_name])
+            if joint_name in CONTROLLERS_BUFFER:
+                entry[3] = CONTROLLERS_BUFFER[joint_name].longName()
+                entry[4] = list(CONTROLLERS_ROTATE_AXIS_BUFFER[joint_name]) + list(CONTROLLERS_INIT_ORIENT_BUFFER[joint_name])
+            mapping.append(entry)
+
+        scene_path = cmds.file(query=True, sceneName=True)
+        cache = {}
+        cache["version"] = MAPPING_CACHE_VERSION
+        cache["scene"] = scene_path
+        cache["files"] = _get_scene_files()
+        cache["hierarchy"] = _get_hierarchy_hash()
+        cache["namespace"] = MAPPING_NAMESPACE
+        cache["mapping"] = mapping # [name, joint path, joint rest, controller path, controller rest]
+        cache["rest_attributes"] = _get_rest_attributes(set([maya_path for entry in mapping for maya_path in (entry[1], entry[3]) if maya_path]))
+        cache["roots"] = dict([(root_name, maya_node.longName()) for root_name, maya_node in ROOTS_SYSTEM.items()])
+
+        if not os.path.isdir(os.path.dirname(cache_file)):
+            os.makedirs(os.path.dirname(cache_file))
+        with open(cache_file, "w") as cache_stream:
+            json.dump(cache, cache_stream)
+        _print_verbose("mapping saved to " + cache_file, 2)
+    except Exception as e:
+        _print_verbose("cannot save mapping cache (" + type(e).__name__ + ": " + str(e) + ")", 1)
+
+
+def _get_scene_files():
+    '''
+    Return {file path: modification time} of the scene file and of every file it references, nested references included.
+    '''
+    file_paths = [cmds.file(query=True, sceneName=True)]
+    for reference_node in cmds.ls(type="reference") or []:
+        try:
+            file_paths.append(cmds.referenceQuery(reference_node, filename=True, withoutCopyNumber=True))
+        except RuntimeError:
+            pass # sharedReferenceNode has no file
+    return dict([(file_path, os.path.getmtime(file_path) if os.path.isfile(file_path) else None) for file_path in file_paths])
+
+
+def _get_rest_attributes(maya_paths):
+    '''
+    Return {maya path: rotateAxis then jointOrient (joints only)}: the attributes the cached rest quaternions come from.
+    '''
+    rest_attributes = {}
+    for maya_path in maya_paths:
+        values = list(cmds.getAttr(maya_path + ".rotateAxis")[0])
+        if cmds.objectType(maya_path, isAType="joint"):
+            values.extend(cmds.getAttr(maya_path + ".jointOrient")[0])
+        rest_attributes[maya_path] = values
+    return rest_attributes
+
+
+def _get_cached_mapping(cache):
+    # Rest values are the forward rotate axis then init orient quaternions, x y z w
+    mapping = []
+    for joint_name, joint_path, joint_rest, controller_path, controller_rest in cache["mapping"]:
+        maya_joint = pmc.PyNode(joint_path) if joint_path else None
+        maya_controller = pmc.PyNode(controller_path) if controller_path else None
+        mapping.append((joint_name, maya_joint, _get_cached_rest(joint_rest), maya_controller, _get_cached_rest(controller_rest)))
+    return mapping
+
+
+def _get_cached_rest(values):
+    if not values:
+        return None
+    return pmc.datatypes.Quaternion(*values[:4]), pmc.datatypes.Quaternion(*values[4:])
+
+
+################################################################################
+##########          Rest transforms (rotate axis and joint orient) helpers
+################################################################################
+def _get_rest_rotate_axis(maya_node):
+    vRO = maya_node.getRotateAxis()
+    return pmc.datatypes.EulerRotation(vRO[0], vRO[1], vRO[2]).asQuaternion()
+
+
+def _watch_rest_transform(mosketch_name, maya_node, is_controller):
+    '''
+    Rest transforms are computed once at mapping time.
+    We only recompute them when Maya tells us rotateAxis or jointOrient changed.
+    '''
+    try:
+        callback_id = OpenMaya.MNodeMessage.addAttributeChangedCallback(maya_node.__apimobject__(), _rest_attribute_changed, (mosketch_name, is_controller))
+        REST_CALLBACKS[(mosketch_name, is_controller)] = callback_id
+    except Exception as e:
+        _print_verbose("cannot watch rest transform of " + mosketch_name + " (" + str(e) + ")", 1)
+
+
+def _unwatch_rest_transform(mosketch_name, is_controller):
+    callback_id = REST_CALLBACKS.pop((mosketch_name, is_controller), None)
+    if callback_id is not None:
+        try:
+            OpenMaya.MMessage.removeCallback(callback_id)
+        except Exception:
+            pass # Node has been deleted in the meantime
+
+
+def _remove_rest_callbacks():
+    global REST_CALLBACKS
+
+    for callback_id in REST_CALLBACKS.values():
+        try:
+            OpenMaya.MMessage.removeCallback(callback_id)
+        except Exception:
+            pass # Node has been deleted in the meantime
+    REST_CALLBACKS = {}
+
+
+def _rest_attribute_changed(msg, plug, other_plug, client_data):
+    if not (msg & OpenMaya.MNodeMessage.kAttributeSet):
+        return
+
+    attribute_name = plug.partialName(False, False, False, False, False, True)
+    if attribute_name.startswith("rotateAxis"):
+        _refresh_rest_transform(client_data[0], client_data[1], False)
+    elif attribute_name.startswith("jointOrient"):
+        _refresh_rest_transform(client_data[0], client_data[1], True)
+
+
+def _refresh_rest_transform(mosketch_name, is_controller, refresh_orient):
+    if is_controller:
+        maya_node = CONTROLLERS_BUFFER.get(mosketch_name)
+        rotate_axis_buffer = CONTROLLERS_ROTATE_AXIS_BUFFER
+        rotate_axis_inv_buffer = CONTROLLERS_ROTATE_AXIS_INV_BUFFER
+        init_orient_buffer = CONTROLLERS_INIT_ORIENT_BUFFER
+        init_orient_inv_buffer = CONTROLLERS_INIT_ORIENT_INV_BUFFER
+    else:
+        maya_node = JOINTS_BUFFER.get(mosketch_name)
+        rotate_axis_buffer = JOINTS_ROTATE_AXIS_BUFFER
+        rotate_axis_inv_buffer = JOINTS_ROTATE_AXIS_INV_BUFFER
+        init_orient_buffer = JOINTS_INIT_ORIENT_BUFFER
+        init_orient_inv_buffer = JOINTS_INIT_ORIENT_INV_BUFFER
+
+    if maya_node is None:
+        return
+
+    RO = _get_rest_rotate_axis(maya_node)
+    rotate_axis_buffer[mosketch_name] = RO
+    rotate_axis_inv_buffer[mosketch_name] = RO.inverse()
+    if refresh_orient:
+        # Only joints have a jointOrient. Transforms keep the initial transform taken at mapping time.
+        JO = maya_node.getOrientation()
+        init_orient_buffer[mosketch_name] = JO
+        init_orient_inv_buffer[mosketch_name] = JO.inverse()
+    _reset_pose_plan() # Rebuilt with the new rest quaternions on next send
+    _print_verbose("rest transform refreshed for " + mosketch_name, 2)
+
+
+################################################################################
+##########          MAYA NODE UUIDS
+##########          The mapping is anchored on Maya UUIDs: renaming or reparenting a mapped node only refreshes its own entries
+################################################################################
+def _get_maya_uuid(maya_node):
+    return OpenMaya.MFnDependencyNode(maya_node.__apimobject__()).uuid().asString()
+
+
+def _watch_maya_uuid(mosketch_name, maya_node, is_controller):
+    try:
+        maya_uuid = _get_maya_uuid(maya_node)
+    except Exception as e:
+        _print_verbose("cannot get uuid of " + mosketch_name + " (" + str(e) + ")", 1)
+        return
+
+    MAYA_UUIDS[(mosketch_name, is_controller)] = maya_uuid
+    entries = MAYA_UUID_ENTRIES.setdefault(maya_uuid, set())
+    entries.add((mosketch_name, is_controller))
+    if maya_uuid in MAYA_UUID_CALLBACKS:
+        return # A joint mapped on itself as controller: one set of callbacks per node
+
+    try:
+        callback_ids = []
+        callback_ids.append(OpenMaya.MNodeMessage.addNameChangedCallback(maya_node.__apimobject__(), _maya_node_renamed, maya_uuid))
+        callback_ids.append(OpenMaya.MDagMessage.addParentAddedDagPathCallback(maya_node.__apimdagpath__(), _maya_node_reparented, maya_uuid))
+        MAYA_UUID_CALLBACKS[maya_uuid] = callback_ids
+    except Exception as e:
+        _print_verbose("cannot watch renames of " + mosketch_name + " (" + str(e) + ")", 1)
+
+
+def _unwatch_maya_uuid(mosketch_name, is_controller):
+    maya_uuid = MAYA_UUIDS.pop((mosketch_name, is_controller), None)
+    if maya_uuid is None:
+        return
+    entries = MAYA_UUID_ENTRIES.get(maya_uuid)
+    if entries:
+        entries.discard((mosketch_name, is_controller))
+        if entries:
+            return # Still mapped under another entry
+    MAYA_UUID_ENTRIES.pop(maya_uuid, None)
+    for callback_id in MAYA_UUID_CALLBACKS.pop(maya_uuid, []):
+        try:
+            OpenMaya.MMessage.removeCallback(callback_id)
+        except Exception:
+            pass # Node has been deleted in the meantime
+
+
+def _remove_maya_uuid_callbacks():
+    global MAYA_UUIDS
+    global MAYA_UUID_ENTRIES
+    global MAYA_UUID_CALLBACKS
+
+    for callback_ids in MAYA_UUID_CALLBACKS.values():
+        for callback_id in callback_ids:
+            try:
+                OpenMaya.MMessage.removeCallback(callback_id)
+            except Exception:
+                pass # Node has been deleted in the meantime
+    MAYA_UUIDS = {}
+    MAYA_UUID_ENTRIES = {}
+    MAYA_UUID_CALLBACKS = {}
+
+
+def _maya_node_renamed(node, previous_name, maya_uuid):
+    _refresh_maya_node(maya_uuid, previous_name)
+
+
+def _maya_node_reparented(child_path, parent_path, maya_uuid):
+    _refresh_maya_node(maya_uuid, None)
+
+
+def _refresh_maya_node(maya_uuid, previous_name):
+    '''
+    Resolve the node again from its UUID and update only the entries mapped on it.
+    '''
+    maya_paths = cmds.ls(maya_uuid, long=True)
+    if not maya_paths:
+        return
+    maya_node = pmc.PyNode(maya_paths[0])
+
+    for mosketch_name, is_controller in MAYA_UUID_ENTRIES.get(maya_uuid, ()):
+        if is_controller:
+            CONTROLLERS_BUFFER[mosketch_name] = maya_node
+        else:
+            JOINTS_BUFFER[mosketch_name] = maya_node
+        if mosketch_name in INTER_JOINTS_BUFFER and not is_controller:
+            INTER_JOINTS_BUFFER[mosketch_name] = maya_node
+
+    # Scene lookups of the old and new names are out of date: they will be queried again if ever needed
+    for name in (previous_name, maya_paths[0]):
+        if name:
+            name = name.rpartition('|')[2].rpartition(':')[2]
+            SCENE_JOINTS.pop(name, None)
+            SCENE_TRANSFORMS.pop(name, None)
+    _print_verbose("node refreshed after rename/reparent: " + maya_paths[0], 2)
 
 
 ################################################################################
-##########          Send joints that should be non sketchable in one big message
+##########          Send joints that should be non sketchable
+##########          Inter joints are found at mapping time (see _update_inter_joints)
 ################################################################################
+def _send_inter_joints():
+    _print_verbose("Total inter joints found: " + str(len(INTER_JOINTS_BUFFER)), 1)
+    _send_inter_joints_names(sorted(INTER_JOINTS_BUFFER.keys()))
+
+
 def _send_static_inter_joints():
-    joints_stream = {}
-    joints_stream[JSON_KEY_TYPE] = "InterJoints"
-    joints_stream[JSON_KEY_JOINTS] = []
-    joint_data = {} # Reinit it
-    joint_data[JSON_KEY_NAME] = "HipPart1_L"
-    joints_stream[JSON_KEY_JOINTS].append(joint_data)
-
-    joint_data = {} # Reinit it
-    joint_data[JSON_KEY_NAME] = "HipPart2_L"
-    joints_stream[JSON_KEY_JOINTS].append(joint_data)
-
-    json_data = json.dumps(joints_stream)
-    CONNECTION.write(json_data)
+    _send_inter_joints_names(RIG["static_inter_joints"])
+
+
+def _send_inter_joints_names(joints_name):
+    '''
+    Send joints_name as InterJoints, INTER_JOINTS_CHUNK names per packet: a big rig never produces one giant blocking write.
+    '''
+    for start in range(0, len(joints_name), INTER_JOINTS_CHUNK):
+        joints_stream = {}
+        joints_stream[JSON_KEY_TYPE] = "InterJoints"
+        joints_stream[JSON_KEY_JOINTS] = [{JSON_KEY_NAME: joint_name} for joint_name in joints_name[start:start + INTER_JOINTS_CHUNK]]
+        json_data = json.dumps(joints_stream)
+        CONNECTION.write(json_data)
 
 
 ################################################################################
@@ -765,10 +2802,13 @@ def _process_joints_stream(joints_stream_data):
     global JOINTS_INIT_ORIENT_INV_BUFFER
     global JOINTS_ROTATE_AXIS_INV_BUFFER
 
-    if ((MODEL_NAME == "Mosko_Rigged") or (MODEL_NAME == "DeepSea_Rigged")):
+    global LIVE_APPLYING
+
+    if RIG["controllers"]:
         _process_controllers_stream(joints_stream_data)
         return
 
+    LIVE_APPLYING = True
     try:
         joints_data = joints_stream_data[JSON_KEY_JOINTS]
         _print_verbose(joints_data, 3)
@@ -786,7 +2826,13 @@ def _process_joints_stream(joints_stream_data):
                 quat = pmc.datatypes.Quaternion(joint_data[JSON_KEY_ROTATION])
                 rotate_axis_inv = JOINTS_ROTATE_AXIS_INV_BUFFER[joint_name]
                 joint_orient_inv = JOINTS_INIT_ORIENT_INV_BUFFER[joint_name]
-                quat = rotate_axis_inv * quat * joint_orient_inv
+                if (joint_name == RIG["root_controller"]):
+                    # The root joint has a pre transform (Mokto)
+                    offset = ROOTS_SYSTEM[RIG["root_pre_transform"]]
+                    oJO = offset.getRotation(space='transform', quaternion=True)
+                    quat = oJO.inverse() * rotate_axis_inv * quat * joint_orient_inv * oJO
+                else:
+                    quat = rotate_axis_inv * quat * joint_orient_inv
                 maya_joint.setRotation(quat, space='transform')
                 
                 joint_type = joint_data[JSON_KEY_ANATOMIC]                
@@ -795,14 +2841,20 @@ def _process_joints_stream(joints_stream_data):
                     trans = trans.rotateBy(rotate_axis_inv)
                     # Mosketch uses meters. Maya uses centimeters
                     trans *= 100
+                    if (joint_name == RIG["root_controller"]):
+                        offset = ROOTS_SYSTEM[RIG["root_offset"]]
+                        oT = offset.getTranslation(space='transform')
+                        trans -= oT
                     maya_joint.setTranslation(trans, space='transform')
 
-        _send_ack_jointstream_received()
+        _send_ack_jointstream_received(joints_stream_data)
     except KeyError as e:
         _print_error("cannot find " + joint_name + " in maya")
         return
     except Exception as e:
         _print_error("cannot process joints stream (" + type(e).__name__ + ": " + str(e) +")")
+    finally:
+        LIVE_APPLYING = False
 
 
 ################################################################################
@@ -816,7 +2868,9 @@ def _process_controllers_stream(joints_stream_data):
     global CONTROLLERS_BUFFER
     global CONTROLLERS_INIT_ORIENT_INV_BUFFER
     global CONTROLLERS_ROTATE_AXIS_INV_BUFFER
+    global LIVE_APPLYING
 
+    LIVE_APPLYING = True
     try:
         joints_data = joints_stream_data[JSON_KEY_JOINTS]
         _print_verbose(joints_data, 3)
@@ -836,9 +2890,9 @@ def _process_controllers_stream(joints_stream_data):
                 rotate_axis_inv = CONTROLLERS_ROTATE_AXIS_INV_BUFFER[joint_name]
                 orient_inv = CONTROLLERS_INIT_ORIENT_INV_BUFFER[joint_name]
 
-                if (joint_name == "RootX_M"):
+                if (joint_name == RIG["root_controller"]):
                     # The root controller has a pre transform
-                    offset = ROOTS_SYSTEM["FKOffsetRoot_M"];
+                    offset = ROOTS_SYSTEM[RIG["root_pre_transform"]];
                     oJO = offset.getRotation(space='transform', quaternion=True)
                     quat = oJO.inverse() * rotate_axis_inv * quat * orient_inv * oJO
                     maya_controller.setRotation(quat, space='transform')
@@ -855,25 +2909,21 @@ def _process_controllers_stream(joints_stream_data):
                     # Mosketch uses meters. Maya uses centimeters
                     trans *= 100
 
-                    if (MODEL_NAME == 'Mosko_Rigged'):
-                        if (joint_name == "RootX_M"):
-                            offset = ROOTS_SYSTEM["RootCenter_M"];#Todo: Give uniq name (left as is for example/clarity purpose)
-                            oT = offset.getTranslation(space='transform')
-                            trans -= oT
-                    elif (MODEL_NAME == 'DeepSea_Rigged'):
-                        if (joint_name == "RootX_M"):
-                            offset = ROOTS_SYSTEM["RootOffsetX_M"];#Todo: Give uniq name (left as is for example/clarity purpose)
-                            oT = offset.getTranslation(space='transform')
-                            trans -= oT
+                    if (joint_name == RIG["root_controller"]):
+                        offset = ROOTS_SYSTEM[RIG["root_offset"]]
+                        oT = offset.getTranslation(space='transform')
+                        trans -= oT
 
                     maya_controller.setTranslation(trans, space='transform')
 
-        _send_ack_jointstream_received()
+        _send_ack_jointstream_received(joints_stream_data)
     except KeyError as e:
         _print_error("cannot find " + joint_name + " in maya")
         return
     except Exception as e:
         _print_error("cannot process joints stream (" + type(e).__name__ + ": " + str(e) +")")
+    finally:
+        LIVE_APPLYING = False
 
 
 ################################################################################
@@ -929,9 +2979,11 @@ def _process_joints_uuids(data):
         joints_data = data[JSON_KEY_JOINTS]
         _print_verbose(joints_data, 3)
 
+        # A list of {name: uuid}
+        JOINTS_UUIDS = {}
         for joint_data in joints_data:
-            for name in joint_data:
-                JOINTS_UUIDS[name] = joint_data[name]
+            JOINTS_UUIDS.update(joint_data)
+        _index_joints_uuids()
 
     except Exception as e:
         _print_error("cannot process joints uuids (" + type(e).__name__ + ": " + str(e) +")")
@@ -941,14 +2993,57 @@ def _process_joints_uuids(data):
     #NEXT SECTION: Test/desmonstrate the use of Mosketch commands
     #_send_command_selectJoint('Wrist_L')
     #_send_command_wireframe('true')
-    #_send_command_setSketchable(JOINTS_UUIDS['Spine2_M'], 'false')
-    #_send_command_setSketchable(JOINTS_UUIDS['Spine3_M'], 'false')
+    #_send_command_setSketchable(_get_joint_uuid('Spine2_M'), 'false')
+    #_send_command_setSketchable(_get_joint_uuid('Spine3_M'), 'false')
     #Test selecting joints and adding effectors
     #_send_command_selectJoint('Toes_L', '1')
     #_send_command_selectJoint('Toes_R', '0')
     #_send_command_addEffector()
 
 
+################################################################################
+##########          Two-way index between Mosketch uuids, hierarchy slots and Maya nodes
+##########          Built once per Hierarchy / JointsUuids packet, then every lookup is O(1)
+################################################################################
+def _index_hierarchy_slots():
+    global HIERARCHY_SLOTS
+
+    HIERARCHY_SLOTS = dict((joint_name, slot) for slot, joint_name in enumerate(HIERARCHY_JOINTS))
+    _index_joints_uuids()
+
+
+def _index_joints_uuids():
+    global UUIDS_SLOT
+    global SLOTS_UUID
+
+    SLOTS_UUID = [JOINTS_UUIDS.get(joint_name) for joint_name in HIERARCHY_JOINTS]
+    UUIDS_SLOT = dict((uuid, slot) for slot, uuid in enumerate(SLOTS_UUID) if uuid is not None)
+
+
+def _get_uuid_joint_name(uuid):
+    slot = UUIDS_SLOT.get(uuid)
+    if slot is None:
+        return None
+    return HIERARCHY_JOINTS[slot]
+
+
+def _get_uuid_maya_node(uuid):
+    '''
+    Return the Maya node driven by the Mosketch joint uuid (controller for rigged models), or None if not mapped.
+    '''
+    joint_name = _get_uuid_joint_name(uuid)
+    if joint_name is None:
+        return None
+    return _get_live_buffer().get(joint_name)
+
+
+def _get_joint_uuid(joint_name):
+    slot = HIERARCHY_SLOTS.get(joint_name)
+    if slot is None:
+        return JOINTS_UUIDS.get(joint_name)
+    return SLOTS_UUID[slot]
+
+
 ################################################################################
 ##########          Set a joint sketchable through a command
 #in uuid
@@ -979,10 +3074,9 @@ def _send_command_setSketchable(uuid, sketchable):
 def _send_command_selectJoint(joint_name):
     global CONNECTION
 
-    try:
-        uuid = JOINTS_UUIDS[joint_name]
-    except Exception as e:
-        _print_error("cannot find joint uuid for (" + type(e).__name__ + ": " + str(e) +")")
+    uuid = _get_joint_uuid(joint_name)
+    if uuid is None:
+        _print_error("cannot find joint uuid for " + joint_name)
         return
 
     packet = {}
@@ -1049,65 +3143,159 @@ def _send_command_jointSpace(space_mode):
 ################################################################################
 def _initial_settings():
     global MODEL_NAME
-    global PREFIX_FKX
-    global PREFIX_FK
+    global RIG
 
+    # The scene may have changed since start(): the Hierarchy will be mapped with this profile
+    if AUTO_DETECT_RIG:
+        MODEL_NAME = _detect_rig_profile()
     _print_verbose("initial settings for " + MODEL_NAME, 1)
-    if (MODEL_NAME == 'Mosko_Rigged'):
-        PREFIX_FKX = 'FKX'
-        PREFIX_FK = 'FK'
-    elif (MODEL_NAME == "DeepSea_Rigged"):
-        PREFIX_FKX = 'FKX'
-        PREFIX_FK = 'FK'
+    RIG = COMPILED_RIG_PROFILES[MODEL_NAME]
+
+
+def _detect_rig_profile():
+    '''
+    Return the profile whose signature nodes are best found in the scene.
+    One exact-name ls of all signature nodes (in NAMESPACE if set, else in all namespaces), no scene listing.
+    Confidence is the found part of the signature, profiles with a signature_absent node in the scene are left out.
+    Two profiles with the same best confidence are ambiguous: RIG_DETECT_FALLBACK is used.
+    '''
+    start_time = time.time()
+    signature_names = set()
+    for rig in COMPILED_RIG_PROFILES.values():
+        signature_names.update(rig["signature"])
+        signature_names.update(rig["signature_absent"])
+    found_names = set()
+    if signature_names:
+        if NAMESPACE is None:
+            found = cmds.ls(list(signature_names), type="transform", recursive=True) or []
+        else:
+            found = cmds.ls([NAMESPACE + ":" + name for name in signature_names], type="transform") or []
+        found_names = set([maya_path.rpartition('|')[2].rpartition(':')[2] for maya_path in found])
+
+    scores = []
+    for model_name, rig in COMPILED_RIG_PROFILES.items():
+        if not rig["signature"] or found_names.intersection(rig["signature_absent"]):
+            continue
+        matched = len(found_names.intersection(rig["signature"]))
+        scores.append((float(matched) / len(rig["signature"]), matched, model_name))
+    scores.sort(reverse=True)
+    detect_time = (time.time() - start_time) * 1000.0
+
+    if not scores or scores[0][0] < RIG_DETECT_MIN_CONFIDENCE:
+        _print_verbose("rig detection: no signature found, using " + RIG_DETECT_FALLBACK + " (" + "%.1f" % detect_time + " ms)", 1)
+        return RIG_DETECT_FALLBACK
+    if len(scores) > 1 and scores[1][0] == scores[0][0]:
+        _print_verbose("WARNING: rig detection: " + scores[0][2] + " and " + scores[1][2] + " match equally (" + "%d%%" % (scores[0][0] * 100)
+                       + "), using " + RIG_DETECT_FALLBACK + ": start() with a model name", 0)
+        return RIG_DETECT_FALLBACK
+
+    confidence, matched, model_name = scores[0]
+    details = "%d%%" % (confidence * 100) + ", " + str(matched) + "/" + str(len(COMPILED_RIG_PROFILES[model_name]["signature"])) + " signature nodes"
+    if len(scores) > 1:
+        details += ", next " + scores[1][2] + " " + "%d%%" % (scores[1][0] * 100)
+    _print_verbose("rig detection: " + model_name + " (" + details + ") in " + "%.1f" % detect_time + " ms", 1)
+    return model_name
+
+
+def _compile_rig_profile(profile):
+    '''
+    Fill the profile defaults and turn its name lists into frozensets and dicts, so that rules are O(1) lookups.
+    '''
+    rig = {}
+    rig["controllers"] = profile.get("controllers", False)
+    rig["joints_any_transform"] = profile.get("joints_any_transform", False)
+    rig["controller_prefix"] = profile.get("controller_prefix", "")
+    rig["fkx_prefix"] = profile.get("fkx_prefix", "")
+    rig["fkx_joints"] = frozenset(profile.get("fkx_joints", []))
+    rig["controller_exceptions"] = dict(profile.get("controller_exceptions", {}))
+    rig["root_controller"] = profile.get("root_controller")
+    rig["root_pre_transform"] = profile.get("root_pre_transform")
+    rig["root_offset"] = profile.get("root_offset")
+    rig["root_system"] = tuple(profile.get("root_system", []))
+    rig["root_send_offsets"] = profile.get("root_send_offsets", True)
+    rig["orient_mode"] = profile.get("orient_mode")
+    rig["signature"] = tuple(profile.get("signature", []))
+    rig["signature_absent"] = tuple(profile.get("signature_absent", []))
+    rig["static_inter_joints"] = list(profile.get("static_inter_joints", STATIC_INTER_JOINTS))
+    rig["send_static_inter_joints"] = profile.get("send_static_inter_joints", False)
+    # Precomputed by mosketch_rig_compiler.py for a validated hierarchy
+    rig["controller_names"] = dict(profile.get("controller_names", {}))
+    rig["hierarchy"] = profile.get("hierarchy")
+    return rig
+
+
+def _load_rig_artifact():
+    '''
+    Add the profiles of RIG_ARTIFACT_FILE to RIG_PROFILES. A missing or outdated artifact keeps the built-in profiles (no GUI yet: nothing is raised).
+    '''
+    if not RIG_ARTIFACT_FILE or not os.path.isfile(RIG_ARTIFACT_FILE):
+        return
+    try:
+        with open(RIG_ARTIFACT_FILE, "r") as artifact_stream:
+            artifact = json.load(artifact_stream)
+        if artifact.get("format") != RIG_ARTIFACT_FORMAT or artifact.get("version") != RIG_ARTIFACT_VERSION:
+            _print_verbose(RIG_ARTIFACT_FILE + " was compiled for another version, compile it again", 1)
+            return
+        RIG_PROFILES.update(artifact["profiles"])
+        _print_verbose("rig profiles loaded from " + RIG_ARTIFACT_FILE, 1)
+    except Exception as e:
+        _print_verbose("cannot load " + RIG_ARTIFACT_FILE + " (" + type(e).__name__ + ": " + str(e) + ")", 1)
 
 
 ################################################################################
 ##########          If you need any pre transform, fill it here
 ##########          Provided as an example (Might differ with models as shown)
 ################################################################################
+def _get_root_system_names():
+    return list(RIG["root_system"])
+
+
 def _fill_root_system():
-    if (MODEL_NAME == 'Mosko_Rigged'):
-        _print_verbose("Root system for " + MODEL_NAME, 1)
-        all_maya_joints = pmc.ls(type="transform")
-        for maya_joint in all_maya_joints:
-            if (maya_joint.name() == "FKOffsetRoot_M"):
-                _print_verbose("we have our root pre transform", 1)
-                ROOTS_SYSTEM[maya_joint.name()] = maya_joint
-            elif (maya_joint.name() == "RootCenter_M"):
-                _print_verbose("we have our root centre", 1)
-                ROOTS_SYSTEM[maya_joint.name()] = maya_joint
-            elif (maya_joint.name() == "RootSystem"):
-                _print_verbose("we have our RootSystem", 1)
-                ROOTS_SYSTEM[maya_joint.name()] = maya_joint
-    elif (MODEL_NAME == 'DeepSea_Rigged'):
-        _print_verbose("Root system for " + MODEL_NAME, 1)
-        all_maya_joints = pmc.ls(type="transform")
-        for maya_joint in all_maya_joints:
-            if (maya_joint.name() == "FKOffsetRoot_M"):
-                _print_verbose("we have our root pre transform", 1)
-                ROOTS_SYSTEM[maya_joint.name()] = maya_joint
-            elif (maya_joint.name() == "RootOffsetX_M"):
-                _print_verbose("we have RootOffsetX_M", 1)
-                ROOTS_SYSTEM[maya_joint.name()] = maya_joint
+    root_names = _get_root_system_names()
+    if not root_names:
+        return
+
+    _print_verbose("Root system for " + MODEL_NAME, 1)
+    _query_scene_names([], root_names)
+    duplicates = {}
+    for root_name in root_names:
+        maya_node = _lookup_name_index(SCENE_TRANSFORMS, root_name, MAPPING_NAMESPACE, duplicates)
+        if maya_node is not None:
+            _print_verbose("we have our " + root_name, 1)
+            ROOTS_SYSTEM[root_name] = maya_node
+    for root_name in duplicates:
+        _print_error("several Maya nodes are named " + root_name + ". Taking the first one only.")
 
 
 ################################################################################
-##########          Return the controller name for the associated joint_name
+##########          Precomputed controller names are only valid for the Hierarchy they were compiled for
 ################################################################################
-def _deepsea_controllers(joint_name):
-    prefixed_name = PREFIX_FK + joint_name
+def _check_rig_hierarchy():
+    global RIG_CONTROLLER_NAMES
 
-    # except for RooX_M which we want as is with no prefix
-    if joint_name == "RootX_M":
-        prefixed_name = joint_name
-        return prefixed_name
+    RIG_CONTROLLER_NAMES = {}
+    if RIG["hierarchy"] is None:
+        return
+    if RIG["hierarchy"] != _get_hierarchy_hash():
+        _print_verbose("WARNING: " + MODEL_NAME + " was compiled for another hierarchy, controller names come from its rules", 1)
+        return
+    RIG_CONTROLLER_NAMES = RIG["controller_names"]
 
-    # except for the joints we want to map directly on FKX joints
-    names = [name for name in DEEPSEA_FKX_BIND if name == joint_name]
-    if len(names) > 0:
-        prefixed_name = PREFIX_FKX + joint_name
 
-    return prefixed_name
+################################################################################
+##########          Return the Maya controller name for a Mosketch joint name
+################################################################################
+def _get_controller_name(joint_name):
+    controller_name = RIG_CONTROLLER_NAMES.get(joint_name)
+    if controller_name is not None:
+        return controller_name
+    controller_name = RIG["controller_exceptions"].get(joint_name)
+    if controller_name is not None:
+        return controller_name
+    # In Advanced Skeleton Joint's controllers are prefixed with 'FK', some with 'FKX'
+    if joint_name in RIG["fkx_joints"]:
+        return RIG["fkx_prefix"] + joint_name
+    return RIG["controller_prefix"] + joint_name
 
 
 ################################################################################
@@ -1208,3 +3396,9 @@ def is_valid_ipv6_address(address):
 ################################################################################
 ##########          ...
 ################################################################################
+
+
+# Rig profiles are compiled once at load: start() only selects one
+_load_rig_artifact()
+COMPILED_RIG_PROFILES = dict((model_name, _compile_rig_profile(profile)) for model_name, profile in RIG_PROFILES.items())
+RIG = COMPILED_RIG_PROFILES[MODEL_NAME]
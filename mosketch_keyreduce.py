@@ -0,0 +1,154 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function
+"""
+Mosketch for maya, keyframe reduction.
+Runs without Maya. Works on whole channel columns (one sequence of values per channel, all frames),
+and returns the indexes of the keys to keep: curves rebuilt from those keys with linear tangents stay
+within the tolerance of every removed frame.
+Rotations are reduced per joint, not per channel: the error is the angle between the original rotation
+and the one interpolated from the kept euler keys, as Maya evaluates rx, ry and rz independently.
+That angle is at most the sum of the three euler errors: this scalar bound spares most quaternion checks.
+"""
+
+import math
+
+
+# Maya rotateOrder enum, as axis indexes in the order they apply
+ROTATE_ORDERS = ((0, 1, 2), (1, 2, 0), (2, 0, 1), (0, 2, 1), (1, 0, 2), (2, 1, 0)) # xyz, yzx, zxy, xzy, yxz, zyx
+
+
+################################################################################
+##########          QUATERNIONS
+################################################################################
+def euler_to_quaternion(rx, ry, rz, rotate_order=0):
+    '''
+    Return (x, y, z, w) of the euler angles (radians) applied in rotate_order (xyz applies X first).
+    '''
+    sx = math.sin(rx * 0.5)
+    sy = math.sin(ry * 0.5)
+    sz = math.sin(rz * 0.5)
+    axis_quaternions = ((sx, 0.0, 0.0, math.cos(rx * 0.5)), (0.0, sy, 0.0, math.cos(ry * 0.5)), (0.0, 0.0, sz, math.cos(rz * 0.5)))
+    first, second, third = ROTATE_ORDERS[int(rotate_order)]
+    # Later rotations apply on the left (Hamilton product, column vectors)
+    return multiply_quaternions(axis_quaternions[third], multiply_quaternions(axis_quaternions[second], axis_quaternions[first]))
+
+
+def multiply_quaternions(a, b):
+    '''
+    Hamilton product a * b of (x, y, z, w) quaternions: b is applied first.
+    '''
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    return (aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+            aw * bw - ax * bx - ay * by - az * bz)
+
+
+def get_angle(a, b):
+    '''
+    Angle in radians of the rotation from a to b, q and -q being the same rotation.
+    '''
+    dot = abs(a[0] * b[0] + a[1] * b[1] + a[2] * b[2] + a[3] * b[3])
+    return 2.0 * math.acos(min(dot, 1.0))
+
+
+################################################################################
+##########          REDUCTION
+################################################################################
+def reduce_channel(frames, values, tolerance):
+    '''
+    Return (kept indexes, max error) of one scalar channel, values are interpolated linearly between kept keys.
+    '''
+    def get_segment_error(first, last):
+        slope = (values[last] - values[first]) / (frames[last] - frames[first])
+        max_error = -1.0
+        max_index = first
+        for index in range(first + 1, last):
+            error = abs(values[first] + slope * (frames[index] - frames[first]) - values[index])
+            if error > max_error:
+                max_error = error
+                max_index = index
+        return max_error, max_index
+
+    return _reduce(len(values), get_segment_error, tolerance)
+
+
+def reduce_rotation(frames, rx, ry, rz, rotate_order, tolerance):
+    '''
+    Return (kept indexes, max angle error in radians) of the rx, ry, rz columns of one joint.
+    The three channels keep the same keys. Segments are split at a frame over tolerance, not always the worst one.
+    The max error is an upper bound when segments were accepted on the scalar bound.
+    '''
+    quaternions = {} # Computed on demand, most frames never need theirs
+
+    def get_segment_error(first, last):
+        span = float(frames[last] - frames[first])
+        drx = rx[last] - rx[first]
+        dry = ry[last] - ry[first]
+        drz = rz[last] - rz[first]
+        # Rotating by a, b then c and by a', b' then c' differ by at most |a - a'| + |b - b'| + |c - c'|
+        rx0 = rx[first]
+        ry0 = ry[first]
+        rz0 = rz[first]
+        frame0 = frames[first]
+        bounds = [abs(rx0 + drx * blend - x) + abs(ry0 + dry * blend - y) + abs(rz0 + drz * blend - z)
+                  for blend, x, y, z in zip([(frame - frame0) / span for frame in frames[first + 1:last]],
+                                            rx[first + 1:last], ry[first + 1:last], rz[first + 1:last])]
+        max_bound = max(bounds)
+        if max_bound <= tolerance:
+            return max_bound, first + 1 + bounds.index(max_bound)
+
+        def get_error(index):
+            blend = (frames[index] - frame0) / span
+            quat = euler_to_quaternion(rx0 + drx * blend, ry0 + dry * blend, rz0 + drz * blend, rotate_order)
+            if index not in quaternions:
+                quaternions[index] = euler_to_quaternion(rx[index], ry[index], rz[index], rotate_order)
+            return get_angle(quat, quaternions[index])
+
+        # The frame of the worst bound is usually over tolerance: split there
+        worst_index = first + 1 + bounds.index(max_bound)
+        error = get_error(worst_index)
+        if error > tolerance:
+            return error, worst_index
+
+        # Otherwise exact errors by decreasing bound: the segment is split at the first frame over tolerance,
+        # and accepted at the first bound within tolerance (every frame left is within it too)
+        max_error = error
+        for bound, index in sorted(zip(bounds, range(first + 1, last)), reverse=True):
+            if bound <= tolerance:
+                return max(max_error, bound), index
+            if index == worst_index:
+                continue
+            error = get_error(index)
+            if error > tolerance:
+                return error, index
+            max_error = max(max_error, error)
+        return max_error, first + 1
+
+    return _reduce(len(rx), get_segment_error, tolerance)
+
+
+def _reduce(count, get_segment_error, tolerance):
+    '''
+    Douglas-Peucker: split segments at the frame get_segment_error returns (the worst one, or for rotations one over tolerance)
+    until every removed frame is within tolerance.
+    Return (sorted kept indexes, max error of the removed frames).
+    '''
+    if count <= 2:
+        return list(range(count)), 0.0
+    kept = set([0, count - 1])
+    max_removed_error = 0.0
+    segments = [(0, count - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        error, index = get_segment_error(first, last)
+        if error > tolerance:
+            kept.add(index)
+            segments.append((first, index))
+            segments.append((index, last))
+        else:
+            max_removed_error = max(max_removed_error, error)
+    return sorted(kept), max_removed_error
@@ -0,0 +1,229 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function
+"""
+Mosketch for maya, offline rig compiler.
+Runs without Maya. Reads a rig description, validates it against Mosketch Hierarchy name lists
+and writes the artifact mosketch_for_maya loads at start (RIG_ARTIFACT_FILE).
+
+    python mosketch_rig_compiler.py rigs.json -o mosketch_rigs.json
+    python mosketch_rig_compiler.py rigs.json -o mosketch_rigs.json --hierarchy DeepSea_Rigged=deepsea_joints.json
+
+A rig description is {"profiles": {model name: profile}}, profiles use the RIG_PROFILES keys of
+mosketch_for_maya (mosketch_for_maya.export_rig_profiles() writes the built-in ones).
+A hierarchy file is a Hierarchy packet ({"Joints": [...]}), a JSON list of joint names or one name per line.
+"""
+
+import sys
+import json
+import hashlib
+import argparse
+
+
+# Must match RIG_ARTIFACT_FORMAT and RIG_ARTIFACT_VERSION in mosketch_for_maya
+RIG_ARTIFACT_FORMAT = "mosketch-rigs"
+RIG_ARTIFACT_VERSION = 1
+
+# Profile keys and their defaults (see RIG_PROFILES in mosketch_for_maya)
+PROFILE_DEFAULTS = {
+    "controllers": False,
+    "joints_any_transform": False,
+    "controller_prefix": "",
+    "fkx_prefix": "",
+    "fkx_joints": [],
+    "controller_exceptions": {},
+    "root_controller": None,
+    "root_pre_transform": None,
+    "root_offset": None,
+    "root_system": [],
+    "root_send_offsets": True,
+    "orient_mode": None,
+    "signature": [],
+    "signature_absent": [],
+    "static_inter_joints": ["HipPart1_L", "HipPart2_L"],
+    "send_static_inter_joints": False,
+}
+
+
+class RigError(Exception):
+    pass
+
+
+################################################################################
+##########          COMPILE
+################################################################################
+def compile_profile(profile):
+    '''
+    Return the profile with every key filled, names sorted and duplicates removed.
+    '''
+    unknown_keys = sorted(set(profile.keys()) - set(PROFILE_DEFAULTS.keys()))
+    if unknown_keys:
+        raise RigError("unknown keys " + ", ".join(unknown_keys))
+
+    compiled = {}
+    for key, default in PROFILE_DEFAULTS.items():
+        value = profile.get(key, default)
+        if isinstance(default, list):
+            value = sorted(set(value))
+        elif isinstance(default, dict):
+            value = dict(value)
+        compiled[key] = value
+    return compiled
+
+
+def get_controller_name(compiled, joint_name):
+    '''
+    Same rules as mosketch_for_maya._get_controller_name.
+    '''
+    controller_name = compiled["controller_exceptions"].get(joint_name)
+    if controller_name is not None:
+        return controller_name
+    if joint_name in compiled["fkx_joints"]:
+        return compiled["fkx_prefix"] + joint_name
+    return compiled["controller_prefix"] + joint_name
+
+
+def compile_rigs(description, hierarchies=None):
+    '''
+    Compile every profile of description. hierarchies is {model name: [joint names]}:
+    those profiles are validated and get their controller names precomputed.
+    Return (artifact, errors, warnings), errors and warnings are lists of messages.
+    '''
+    hierarchies = hierarchies or {}
+    errors = []
+    warnings = []
+    profiles = {}
+    for model_name, profile in sorted(description.get("profiles", {}).items()):
+        try:
+            compiled = compile_profile(profile)
+        except RigError as e:
+            errors.append(model_name + ": " + str(e))
+            continue
+        profile_errors, profile_warnings = validate_profile(compiled, hierarchies.get(model_name))
+        errors.extend([model_name + ": " + message for message in profile_errors])
+        warnings.extend([model_name + ": " + message for message in profile_warnings])
+
+        joints_name = hierarchies.get(model_name)
+        if joints_name is not None:
+            compiled["hierarchy"] = hashlib.sha1("\n".join(joints_name).encode("utf-8")).hexdigest()
+            if compiled["controllers"]:
+                compiled["controller_names"] = dict((joint_name, get_controller_name(compiled, joint_name)) for joint_name in joints_name)
+        profiles[model_name] = compiled
+
+    for model_name in sorted(set(hierarchies.keys()) - set(profiles.keys())):
+        errors.append(model_name + ": hierarchy given for an unknown profile")
+
+    source = json.dumps(description, sort_keys=True)
+    artifact = {
+        "format": RIG_ARTIFACT_FORMAT,
+        "version": RIG_ARTIFACT_VERSION,
+        "source": hashlib.sha1(source.encode("utf-8")).hexdigest(),
+        "profiles": profiles,
+    }
+    return artifact, errors, warnings
+
+
+################################################################################
+##########          VALIDATE
+################################################################################
+def validate_profile(compiled, joints_name=None):
+    '''
+    Return (errors, warnings) for a compiled profile, checked against joints_name (a Hierarchy) when given.
+    '''
+    errors = []
+    warnings = []
+
+    root_keys = [key for key in ("root_controller", "root_pre_transform", "root_offset") if compiled[key]]
+    if root_keys and len(root_keys) != 3:
+        errors.append("root_controller, root_pre_transform and root_offset go together (only " + ", ".join(root_keys) + " set)")
+    for key in ("root_pre_transform", "root_offset"):
+        if compiled[key] and compiled[key] not in compiled["root_system"]:
+            errors.append(key + " " + compiled[key] + " is not in root_system")
+    if compiled["fkx_joints"] and not compiled["fkx_prefix"]:
+        errors.append("fkx_joints without fkx_prefix")
+    if compiled["orient_mode"] not in (None, 0, 1):
+        errors.append("orient_mode must be 0, 1 or null")
+    both_names = sorted(set(compiled["signature"]).intersection(compiled["signature_absent"]))
+    if both_names:
+        errors.append("signature and signature_absent share " + ", ".join(both_names))
+    if not compiled["controllers"] and (compiled["controller_prefix"] or compiled["fkx_joints"] or compiled["controller_exceptions"]):
+        warnings.append("controller rules are ignored when controllers is false")
+
+    if joints_name is None:
+        return errors, warnings
+
+    names = set(joints_name)
+    if len(names) != len(joints_name):
+        errors.append("hierarchy has duplicated joint names")
+
+    if compiled["controllers"]:
+        joints_of_controller = {}
+        for joint_name in joints_name:
+            joints_of_controller.setdefault(get_controller_name(compiled, joint_name), []).append(joint_name)
+        for controller_name, controller_joints in sorted(joints_of_controller.items()):
+            if len(controller_joints) > 1:
+                errors.append("joints " + ", ".join(controller_joints) + " share controller " + controller_name)
+        driven_names = set(joints_of_controller.keys())
+    else:
+        driven_names = names
+    if compiled["root_controller"] and compiled["root_controller"] not in driven_names:
+        errors.append("root_controller " + compiled["root_controller"] + " is driven by no hierarchy joint")
+
+    for key, key_names in (("fkx_joints", compiled["fkx_joints"]),
+                           ("controller_exceptions", sorted(compiled["controller_exceptions"].keys())),
+                           ("static_inter_joints", compiled["static_inter_joints"])):
+        unknown_names = [name for name in key_names if name not in names]
+        if unknown_names:
+            warnings.append(key + " not in hierarchy: " + ", ".join(unknown_names))
+    return errors, warnings
+
+
+def load_hierarchy_names(file_path):
+    with open(file_path, "r") as hierarchy_stream:
+        text = hierarchy_stream.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [line.strip() for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        data = data["Joints"]
+    return list(data)
+
+
+################################################################################
+##########          MAIN
+################################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile and validate Mosketch rig profiles.")
+    parser.add_argument("description", help="rig description (JSON)")
+    parser.add_argument("-o", "--output", help="artifact to write (nothing is written when omitted)")
+    parser.add_argument("--hierarchy", action="append", default=[], metavar="MODEL=FILE",
+                        help="validate MODEL against the Hierarchy joint names of FILE (repeatable)")
+    args = parser.parse_args(argv)
+
+    with open(args.description, "r") as description_stream:
+        description = json.load(description_stream)
+    hierarchies = {}
+    for hierarchy_arg in args.hierarchy:
+        model_name, _, file_path = hierarchy_arg.partition("=")
+        if not file_path:
+            parser.error("--hierarchy expects MODEL=FILE")
+        hierarchies[model_name] = load_hierarchy_names(file_path)
+
+    artifact, errors, warnings = compile_rigs(description, hierarchies)
+    for message in warnings:
+        print("warning: " + message)
+    for message in errors:
+        print("error: " + message)
+    if errors:
+        return 1
+
+    print(str(len(artifact["profiles"])) + " profiles compiled (" + ", ".join(sorted(artifact["profiles"].keys())) + ")")
+    if args.output:
+        with open(args.output, "w") as artifact_stream:
+            json.dump(artifact, artifact_stream, indent=1, sort_keys=True)
+        print("written to " + args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
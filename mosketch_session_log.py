@@ -0,0 +1,217 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function
+"""
+Mosketch for maya, session logs.
+Runs without Maya. A session log is an append-only binary file of the packets Mosketch sent:
+    header: LOG_MAGIC, then LOG_VERSION as <H
+    records: <dI (seconds since recording started, payload size) followed by the payload (one Json packet, utf-8)
+Sessions appended to an existing log restart their clock at 0.
+"""
+
+import os
+import sys
+import time
+import struct
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+LOG_MAGIC = b"MSKLOG"
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct(str("<6sH"))
+LOG_RECORD = struct.Struct(str("<dI"))
+LOG_QUEUE_SIZE = 4096 # Records waiting for the writer thread, newer ones are dropped past this
+
+
+class LogError(Exception):
+    pass
+
+
+################################################################################
+##########          CLOCK
+################################################################################
+def _get_monotonic_clock():
+    '''
+    Return a clock in seconds that never goes backwards: timestamps must not jump when the system time is set.
+    Python 2 has no time.monotonic: time.clock on Windows, the OS monotonic clock through ctypes elsewhere.
+    time.time is the last resort, it is not monotonic.
+    '''
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+    if sys.platform == "win32":
+        return time.clock # QueryPerformanceCounter, since the first call
+    try:
+        import ctypes
+        import ctypes.util
+        if sys.platform == "darwin":
+            class TimebaseInfo(ctypes.Structure):
+                _fields_ = [(str("numer"), ctypes.c_uint32), (str("denom"), ctypes.c_uint32)]
+            libc = ctypes.CDLL(ctypes.util.find_library(str("c")))
+            libc.mach_absolute_time.restype = ctypes.c_uint64
+            timebase = TimebaseInfo()
+            libc.mach_timebase_info(ctypes.byref(timebase))
+            scale = float(timebase.numer) / timebase.denom / 1000000000.0
+            return lambda: libc.mach_absolute_time() * scale
+
+        class Timespec(ctypes.Structure):
+            _fields_ = [(str("tv_sec"), ctypes.c_long), (str("tv_nsec"), ctypes.c_long)]
+        clock_monotonic = 1 # CLOCK_MONOTONIC on Linux
+        for library in ("c", "rt"): # clock_gettime moved from librt to libc in glibc 2.17
+            library_path = ctypes.util.find_library(str(library))
+            if library_path and hasattr(ctypes.CDLL(library_path), "clock_gettime"):
+                clock_gettime = ctypes.CDLL(library_path).clock_gettime
+                break
+        else:
+            return time.time
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+
+        def monotonic():
+            timespec = Timespec()
+            if clock_gettime(clock_monotonic, ctypes.byref(timespec)) != 0:
+                raise OSError("clock_gettime failed")
+            return timespec.tv_sec + timespec.tv_nsec * 0.000000001
+        monotonic()
+        return monotonic
+    except Exception:
+        return time.time
+
+
+clock = _get_monotonic_clock()
+
+
+################################################################################
+##########          WRITE
+################################################################################
+class Recorder(object):
+    '''
+    Appends packets to a session log from a background thread.
+    record() only takes a timestamp and queues the packet: it never waits for the disk.
+    When the queue is full the packet is dropped and counted.
+    '''
+    def __init__(self, file_path, queue_size=LOG_QUEUE_SIZE):
+        self.file_path = file_path
+        self.records = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.overhead = 0.0 # Seconds spent in record(), that is on the caller's thread
+        self.error = None
+        self._queue = queue.Queue(queue_size)
+        self._stream = _open_log(file_path)
+        self._start_time = clock()
+        self._thread = threading.Thread(target=self._write_records, name="MosketchRecorder")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, packet):
+        start_time = clock()
+        try:
+            self._queue.put_nowait((start_time - self._start_time, packet))
+            self.records += 1
+        except queue.Full:
+            self.dropped += 1
+        self.overhead += clock() - start_time
+
+    def close(self):
+        '''
+        Write the queued records and close the log.
+        '''
+        self._queue.put((None, None))
+        self._thread.join()
+        self._stream.close()
+
+    def get_report(self):
+        mean_overhead = self.overhead / max(self.records + self.dropped, 1)
+        report = (str(self.records) + " records (" + "%.1f" % (self.bytes / 1024.0) + " KB), " + str(self.dropped) + " dropped, "
+                  + "%.1f" % (mean_overhead * 1000000.0) + " us per packet on the receiving thread")
+        if self.error is not None:
+            report += ", writer stopped: " + self.error
+        return report
+
+    def _write_records(self):
+        stream = self._stream
+        while True:
+            timestamp, packet = self._queue.get()
+            if timestamp is None:
+                break
+            if self.error is not None:
+                continue # Keep emptying the queue so that record() never blocks
+            try:
+                if not isinstance(packet, bytes):
+                    packet = packet.encode("utf-8")
+                stream.write(LOG_RECORD.pack(timestamp, len(packet)))
+                stream.write(packet)
+                self.bytes += LOG_RECORD.size + len(packet)
+                # Flush when idle only: one flush per burst of packets
+                if self._queue.empty():
+                    stream.flush()
+            except Exception as e:
+                self.error = type(e).__name__ + ": " + str(e)
+        stream.flush()
+
+
+def _open_log(file_path):
+    if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+        # A crash can leave a truncated record: cut it, or the records appended after it could not be read
+        end = _get_log_end(file_path)
+        stream = open(file_path, "r+b")
+        stream.seek(end)
+        stream.truncate()
+        return stream
+    stream = open(file_path, "ab")
+    stream.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+    return stream
+
+
+def _get_log_end(file_path):
+    '''
+    Return the offset following the last complete record of the log. Payloads are skipped, not read.
+    '''
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as log_stream:
+        _read_header(log_stream)
+        end = LOG_HEADER.size
+        while True:
+            record = log_stream.read(LOG_RECORD.size)
+            if len(record) < LOG_RECORD.size:
+                return end
+            timestamp, size = LOG_RECORD.unpack(record)
+            if end + LOG_RECORD.size + size > file_size:
+                return end
+            end += LOG_RECORD.size + size
+            log_stream.seek(end)
+
+
+################################################################################
+##########          READ
+################################################################################
+def read_log(file_path):
+    '''
+    Yield (timestamp, packet) of every record of the log, packets are utf-8 bytes.
+    A record truncated by a crash ends the log.
+    '''
+    with open(file_path, "rb") as log_stream:
+        _read_header(log_stream)
+        while True:
+            record = log_stream.read(LOG_RECORD.size)
+            if len(record) < LOG_RECORD.size:
+                return
+            timestamp, size = LOG_RECORD.unpack(record)
+            packet = log_stream.read(size)
+            if len(packet) < size:
+                return
+            yield timestamp, packet
+
+
+def _read_header(log_stream):
+    header = log_stream.read(LOG_HEADER.size)
+    if len(header) < LOG_HEADER.size:
+        raise LogError("not a session log (too short)")
+    magic, version = LOG_HEADER.unpack(header)
+    if magic != LOG_MAGIC:
+        raise LogError("not a session log")
+    if version != LOG_VERSION:
+        raise LogError("session log version " + str(version) + " is not supported")
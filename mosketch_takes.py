@@ -0,0 +1,195 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function
+"""
+Mosketch for maya, take files.
+Runs without Maya. A take is a fixed frame rate recording of Mosketch poses, laid out for random access:
+    header: TAKE_MAGIC, then <HIId (version, joint count, frame count, frames per second),
+            <I names size, then the Hierarchy joint names (utf-8, one per line), padded to 4 bytes
+    frames: frame count x joint count x 7 little-endian float32, LR x, y, z, w then LT x, y, z (meters)
+A joint not streamed yet is NaN. LT is NaN for joints streamed without translation (not 6 DoFs).
+Frame k starts at data_offset + k * frame size: reading it is one slice of the mapped file.
+
+    python mosketch_takes.py session.msklog take.msktake --fps 30
+"""
+
+import sys
+import json
+import mmap
+import array
+import struct
+import argparse
+
+import mosketch_session_log
+
+
+TAKE_MAGIC = b"MSKTAKE"
+TAKE_VERSION = 1
+TAKE_HEADER = struct.Struct(str("<7sHIId"))
+TAKE_NAMES_SIZE = struct.Struct(str("<I"))
+TAKE_FRAME_COUNT_OFFSET = 7 + 2 + 4 # Frame count is written again when the take is closed
+VALUES_PER_JOINT = 7
+NAN = float("nan")
+
+
+class TakeError(Exception):
+    pass
+
+
+################################################################################
+##########          WRITE
+################################################################################
+class TakeWriter(object):
+    def __init__(self, file_path, joints_name, fps):
+        self.file_path = file_path
+        self.joints_name = list(joints_name)
+        self.fps = fps
+        self.frame_count = 0
+        self._stream = open(file_path, "wb")
+        names = "\n".join(self.joints_name).encode("utf-8")
+        self._stream.write(TAKE_HEADER.pack(TAKE_MAGIC, TAKE_VERSION, len(self.joints_name), 0, fps))
+        self._stream.write(TAKE_NAMES_SIZE.pack(len(names)))
+        self._stream.write(names)
+        self._stream.write(b"\0" * (-self._stream.tell() % 4))
+
+    def add_frame(self, values):
+        '''
+        values is an array('f') of joint count x 7 values.
+        '''
+        if len(values) != len(self.joints_name) * VALUES_PER_JOINT:
+            raise TakeError("frame has " + str(len(values)) + " values, " + str(len(self.joints_name) * VALUES_PER_JOINT) + " expected")
+        if sys.byteorder != "little":
+            values = array.array(str("f"), values)
+            values.byteswap()
+        values.tofile(self._stream)
+        self.frame_count += 1
+
+    def close(self):
+        self._stream.seek(TAKE_FRAME_COUNT_OFFSET)
+        self._stream.write(struct.pack(str("<I"), self.frame_count))
+        self._stream.close()
+
+
+################################################################################
+##########          READ
+################################################################################
+class Take(object):
+    '''
+    A take file mapped in memory. get_frame(k) costs the same whatever the take length.
+    '''
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._stream = open(file_path, "rb")
+        try:
+            self._map = mmap.mmap(self._stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._stream.close()
+            raise TakeError("not a take (empty file)")
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self):
+        if len(self._map) < TAKE_HEADER.size + TAKE_NAMES_SIZE.size:
+            raise TakeError("not a take (too short)")
+        magic, version, joint_count, frame_count, fps = TAKE_HEADER.unpack_from(self._map, 0)
+        if magic != TAKE_MAGIC:
+            raise TakeError("not a take")
+        if version != TAKE_VERSION:
+            raise TakeError("take version " + str(version) + " is not supported")
+        names_size, = TAKE_NAMES_SIZE.unpack_from(self._map, TAKE_HEADER.size)
+        names_offset = TAKE_HEADER.size + TAKE_NAMES_SIZE.size
+        names = self._map[names_offset:names_offset + names_size].decode("utf-8")
+        self.joints_name = names.split("\n") if names else []
+        if len(self.joints_name) != joint_count:
+            raise TakeError("take header has " + str(joint_count) + " joints but " + str(len(self.joints_name)) + " names")
+        self.fps = fps
+        self.frame_size = joint_count * VALUES_PER_JOINT * 4
+        self.data_offset = names_offset + names_size + (-(names_offset + names_size) % 4)
+        # A take that was not closed has frames but no frame count
+        self.frame_count = frame_count if frame_count else (len(self._map) - self.data_offset) // max(self.frame_size, 1)
+
+    def get_frame(self, frame):
+        '''
+        Return the array('f') of frame: one slice of the mapped file, no parsing.
+        '''
+        if frame < 0 or frame >= self.frame_count:
+            raise IndexError("frame " + str(frame) + " is not in the take (" + str(self.frame_count) + " frames)")
+        start = self.data_offset + frame * self.frame_size
+        values = array.array(str("f"))
+        frame_bytes = self._map[start:start + self.frame_size]
+        if hasattr(values, "frombytes"):
+            values.frombytes(frame_bytes)
+        else:
+            values.fromstring(frame_bytes)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def close(self):
+        self._map.close()
+        self._stream.close()
+
+
+################################################################################
+##########          CONVERT A SESSION LOG
+################################################################################
+def take_from_session_log(log_path, take_path, fps=30.0):
+    '''
+    Resample the first session of a session log to fps: each frame holds the last pose streamed before it,
+    joints that a packet does not mention keep their previous values.
+    Return the number of frames written.
+    '''
+    writer = None
+    slots = {}
+    values = None
+    frame = 0
+    previous_timestamp = -1.0
+    for timestamp, packet in mosketch_session_log.read_log(log_path):
+        if timestamp < previous_timestamp:
+            break # Next session appended to the log
+        previous_timestamp = timestamp
+        data = json.loads(packet.decode("utf-8"))
+        packet_type = data.get("Type")
+        if packet_type == "Hierarchy":
+            if writer is not None:
+                break # Another character: it needs its own take
+            writer = TakeWriter(take_path, data["Joints"], fps)
+            slots = dict((joint_name, slot) for slot, joint_name in enumerate(writer.joints_name))
+            values = array.array(str("f"), [NAN]) * (len(slots) * VALUES_PER_JOINT)
+        elif packet_type == "JointsStream" and writer is not None:
+            # Frames before this packet hold the pose streamed so far
+            packet_frame = int(round(timestamp * fps))
+            while frame < packet_frame:
+                writer.add_frame(values)
+                frame += 1
+            for joint_data in data["Joints"]:
+                slot = slots.get(joint_data["Name"])
+                if slot is None:
+                    continue
+                base = slot * VALUES_PER_JOINT
+                values[base:base + 4] = array.array(str("f"), joint_data["LR"])
+                if joint_data.get("Anatom") == 7:
+                    values[base + 4:base + 7] = array.array(str("f"), joint_data["LT"])
+    if writer is None:
+        raise TakeError("no Hierarchy in " + log_path)
+    writer.add_frame(values)
+    writer.close()
+    return writer.frame_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a Mosketch session log into a take.")
+    parser.add_argument("session_log")
+    parser.add_argument("take")
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    frame_count = take_from_session_log(args.session_log, args.take, args.fps)
+    print(str(frame_count) + " frames written to " + args.take)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())